@@ -1,14 +1,62 @@
 import os
 import sys
+import cProfile
+import io
+import json
+import pstats
 import shutil
-from flask import Flask, request, render_template, jsonify, send_file, after_this_request
+import time
+import tempfile
+import uuid
+import zipfile
+from flask import Flask, Response, request, render_template, jsonify, send_file, after_this_request
 from io import BytesIO
 
+# Metrics of every worker process go to one shared directory (see /metrics). Compile worker processes inherit it
+os.environ.setdefault("KATNIP_METRICS_DIR", os.path.join(tempfile.gettempdir(), "katnip_metrics"))
+
 sys.path.append(os.path.join('app_static', 'parse'))
 import main_parser
+import asset_store
+import archive
+import compile_jobs
+import error_handler
+import hierarchy
+import metrics
+import sb3_cache
 
 app = Flask(__name__, static_folder=os.path.join('..', 'app_static'), template_folder=os.path.join('..', 'app_templates'))
 
+compiled_cache = sb3_cache.sb3_cache() # Compiled sb3 files of recent submissions (per worker process)
+jobs = compile_jobs.job_queue() # Asynchronous compiles (per worker process)
+
+# Set KATNIP_ALLOW_PROFILE=1 to let /translate?profile=1 run a compile under cProfile (returns the profile with the project id)
+ALLOW_PROFILE = os.environ.get("KATNIP_ALLOW_PROFILE", "0") == "1"
+PROFILE_LINES = 40 # Functions listed in a returned profile
+
+def default_content(code):
+    """Wraps the submitted code into a project with the default stage and sprite."""
+
+    return {"Stage": ["",[["Default-Blank", "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR4nGNgYGBgAAAABQABpfZFQAAAAABJRU5ErkJggg=="]]],
+            "S1": [code, [["Smile","data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGPgFvwPAAFGARyS/G3DAAAAAElFTkSuQmCC"]]]
+            }
+
+def server_timing(stages, total_ms):
+    """Formats compile stage timings (see project.stage_timings()) as a Server-Timing header value."""
+
+    return ", ".join([f"{name};dur={stage['ms']}" for name, stage in stages.items()] + [f"total;dur={total_ms:.3f}"])
+
+def reuse_cached(key, data):
+    """Copies a cached sb3 into a new project directory, returning the project's id."""
+
+    id = str(uuid.uuid1()) # Every request gets its own directory, since serving a project removes it
+    os.makedirs(os.path.join('app_static', 'generated_projects', id))
+    with open(os.path.join('app_static', 'generated_projects', id, f"program_{id}.sb3"), "wb") as f:
+        f.write(data)
+    with open(os.path.join('app_static', 'generated_projects', id, f"log_{id}.txt"), "w", encoding="utf-8") as f:
+        f.write(f"Log file for project {id}\n♻️ - Reused cached project {key}\n")
+    return id
+
 @app.route('/')
 def homepage():
     """Displays the homepage."""
@@ -31,19 +79,30 @@ def serve_project(id):
     # Create filename
     filename = f"program_{id}.sb3"
 
+    # Compile jobs are served once they are finished
+    status = compile_jobs.read_status(id)
+    if status and status["status"] in (compile_jobs.QUEUED, compile_jobs.RUNNING):
+        return jsonify(status), 202
+
+    # Read file into io object to avoid problems with deleting files in use
+    try:
+        with open(os.path.join('app_static', 'generated_projects', id, filename), "rb") as f:
+            file_data = BytesIO(f.read())
+    except FileNotFoundError:
+        if status and status["status"] == compile_jobs.FAILED: # The worker crashed before writing the sb3. The status (and its error) is kept for the client
+            return jsonify(status), 500
+        return jsonify({"error": f"Unknown project '{id}'"}), 404
+
     @after_this_request
     def clear_files(response):
         """Remove the temporary file after serving."""
         
-        file_path = os.path.join('app_static', 'generated_projects', id)
-        shutil.rmtree(file_path)
+        if response.status_code == 200:
+            file_path = os.path.join('app_static', 'generated_projects', id)
+            shutil.rmtree(file_path, ignore_errors=True)
 
         return response
 
-    # Read file into io object to avoid problems with deleting files in use
-    with open(os.path.join('app_static', 'generated_projects', id, filename), "rb") as f:
-        file_data = BytesIO(f.read())
-
     return send_file(
         file_data,
         as_attachment=False,
@@ -51,26 +110,181 @@ def serve_project(id):
         download_name=filename
     )
 
+@app.route("/hierarchy/<id>")
+def project_hierarchy(id):
+    """Streams the block hierarchy of a generated project (before it is served), built from its sb3 on demand."""
+
+    path = os.path.join('app_static', 'generated_projects', id, f"program_{id}.sb3")
+    try:
+        project_data = archive.read_project(path)
+    except (FileNotFoundError, KeyError, zipfile.BadZipFile, ValueError):
+        return jsonify({"error": f"Unknown project '{id}'"}), 404
+
+    return Response(hierarchy.iter_hierarchy(project_data), mimetype="text/plain; charset=utf-8")
+
 @app.route('/translate', methods=['POST'])
 def translate():
     """Translates ScratchText language into an .SB3 file located at app_static/generated_projects/id/program.sb3"""
     
+    start = time.perf_counter()
     code = request.data.decode('utf-8') # Decode code
     
     # Create code structure
-    code = {"Stage": ["",[["Default-Blank", "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR4nGNgYGBgAAAABQABpfZFQAAAAABJRU5ErkJggg=="]]],
-               "S1": [code, [["Smile","data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGPgFvwPAAFGARyS/G3DAAAAAElFTkSuQmCC"]]]
-               }
+    code = default_content(code)
+
+    profile = request.args.get("profile") == "1"
+    if profile and not ALLOW_PROFILE:
+        return jsonify({"error": "Profiling is switched off (set KATNIP_ALLOW_PROFILE=1)"}), 403
     
+    # Identical submissions reuse the compiled sb3 (profiled compiles always compile)
+    key = sb3_cache.cache_key(code)
+    data = None if profile else compiled_cache.get(key)
+    if data is not None:
+        metrics.registry.record_compile("translate", "cached", time.perf_counter() - start)
+        response = jsonify({"proj_id": reuse_cached(key, data)})
+        response.headers["Server-Timing"] = f'cache;desc="hit", total;dur={(time.perf_counter() - start) * 1000:.3f}'
+        return response
+
     # Translate code
-    project_parser = main_parser.project()
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    with metrics.registry.in_flight():
+        project_parser = main_parser.project()
+        outcome = "ok"
+        try:
+            project_parser.process_scrtxt(code)  # Make this be all items not just 0th
+        except error_handler.CmdError as e:
+            outcome = "cmd_error"
+            print(f"Error processing code: {e}")
+        except Exception as e:
+            outcome = "error"
+            print(f"Error processing code: {e}")
+        project_parser.write(fast=True) # The editor is waiting on this compile
+    if profiler:
+        profiler.disable()
+    metrics.registry.record_compile("translate", outcome, time.perf_counter() - start, project_parser)
+
+    # Only cache projects that compiled without errors
+    if outcome == "ok":
+        compiled_cache.put(key, project_parser.sb3)
+
+    result = {"proj_id": project_parser.id}
+    if profiler:
+        stats = io.StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        result["profile"] = stats.getvalue()
+    response = jsonify(result)
+    response.headers["Server-Timing"] = server_timing(project_parser.stage_timings(), (time.perf_counter() - start) * 1000)
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queues a ScratchText compile, returning its job id right away. Poll /jobs/<id>, then get the result from /projects/<id>."""
+
+    code = default_content(request.data.decode('utf-8'))
+
+    # Identical submissions are done right away
+    key = sb3_cache.cache_key(code)
+    data = compiled_cache.get(key)
+    if data is not None:
+        id = reuse_cached(key, data)
+        compile_jobs.write_status(id, compile_jobs.DONE)
+        metrics.registry.record_compile("jobs", "cached", 0)
+        return jsonify({"job_id": id, "status": compile_jobs.DONE}), 202
+
+    def cache_result(result):
+        if result["status"] == compile_jobs.DONE:
+            compiled_cache.put(key, result["sb3"])
+
     try:
-        project_parser.process_scrtxt(code)  # Make this be all items not just 0th
-    except Exception as e:
-        print(f"Error processing code: {e}")
-    project_parser.write()
-    
-    return jsonify({"proj_id": project_parser.id})
+        id = jobs.submit(code, on_done=cache_result)
+    except compile_jobs.QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+    except compile_jobs.PoolUnavailable as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    return jsonify({"job_id": id, "status": compile_jobs.QUEUED}), 202
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """
+    Compiles many projects in one request. Takes a json array of project dicts (the shape process_scrtxt accepts).
+    Returns one zip with program_<n>.sb3 and log_<n>.txt for each project, and results.json with the status and timings of each project.
+    """
+
+    contents = request.get_json(silent=True)
+    if not isinstance(contents, list) or not all(isinstance(content, dict) for content in contents):
+        return jsonify({"error": "Expected a json array of projects"}), 400
+    if len(contents) > compile_jobs.BATCH_LIMIT:
+        return jsonify({"error": f"Batches can have at most {compile_jobs.BATCH_LIMIT} projects"}), 413
+
+    # Identical projects reuse the compiled sb3, the others are compiled at the same time
+    start = time.perf_counter()
+    keys = [sb3_cache.cache_key(content) for content in contents]
+    cached = [compiled_cache.get(key) for key in keys]
+    misses = [idx for idx, data in enumerate(cached) if data is None]
+    try:
+        compiled = jobs.run_batch([contents[idx] for idx in misses])
+    except compile_jobs.QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+    except compile_jobs.PoolUnavailable as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    results = [{"status": compile_jobs.DONE, "error": None, "sb3": data, "log": f"♻️ - Reused cached project {key}\n", "timings": {"compile_ms": 0, "package_ms": 0, "total_ms": 0, "stages": {}}, "cached": True}
+               for key, data in zip(keys, cached)]
+    for _ in range(len(contents) - len(misses)):
+        metrics.registry.inc("katnip_compiles_total", endpoint="batch", outcome="cached")
+    for idx, result in zip(misses, compiled):
+        results[idx] = {**result, "cached": False}
+        if result["status"] == compile_jobs.DONE:
+            compiled_cache.put(keys[idx], result["sb3"])
+
+    # Package everything (sb3 files are already compressed)
+    summary = []
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zipf:
+        for idx, result in enumerate(results):
+            zipf.writestr(f"program_{idx}.sb3", result["sb3"])
+            zipf.writestr(f"log_{idx}.txt", result["log"], compress_type=zipfile.ZIP_DEFLATED)
+            summary.append({"index": idx,
+                            "file": f"program_{idx}.sb3",
+                            "status": result["status"],
+                            "error": result["error"],
+                            "cached": result["cached"],
+                            "timings": result["timings"]})
+        zipf.writestr("results.json", json.dumps({"total_ms": round((time.perf_counter() - start) * 1000, 3), "projects": summary}, indent=1))
+
+    buffer.seek(0)
+    failed = len([result for result in results if result["status"] == compile_jobs.FAILED])
+    response = send_file(buffer, as_attachment=True, mimetype="application/zip", download_name="batch.zip")
+    response.headers["X-Batch-Done"] = str(len(results) - failed)
+    response.headers["X-Batch-Failed"] = str(failed)
+    return response
+
+@app.route('/jobs/<id>')
+def job_status(id):
+    """Returns the status of a compile job (queued, running, done or failed)."""
+
+    status = compile_jobs.read_status(id)
+    if status is None:
+        return jsonify({"error": f"Unknown job '{id}'"}), 404
+    return jsonify(status)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Returns the server's metrics (of every worker process) in the Prometheus text format."""
+
+    generated = os.path.join('app_static', 'generated_projects')
+    projects = len([entry for entry in os.scandir(generated) if entry.is_dir()]) if os.path.isdir(generated) else 0
+    text = metrics.registry.collect({"katnip_generated_projects": projects})
+    return text, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Returns the hit/miss counters of the compiled project cache and the asset store."""
+
+    return jsonify({"sb3": compiled_cache.stats(), "assets": asset_store.store.stats()})
 
 if __name__ == '__main__':
     app.run(debug=True, host="0.0.0.0", port=8080)
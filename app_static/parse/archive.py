@@ -0,0 +1,68 @@
+"""
+Builds sb3 archives (zip files) in memory, without writing project.json or the assets to disk first
+"""
+
+import io
+import json
+import os
+import zipfile
+
+# Already compressed media. Deflating these again costs time and saves (almost) nothing, so they are stored as-is
+STORED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "mp3"}
+
+# Deflate level (1-9) for project.json and the other assets (svg, wav, ...)
+COMPRESS_LEVEL = int(os.environ.get("KATNIP_ZIP_LEVEL", 6))
+FAST_COMPRESS_LEVEL = 1 # Used by interactive compiles, where a quick response matters more than the file size
+
+def compression_for(name: str, fast: bool = False):
+    """
+    Returns how an entry of the archive is compressed
+
+    ### Parameters:
+    - name (str): File name of the entry (e.g. "project.json" or "<md5>.png")
+    - fast (bool): (optional) Use the fastest deflate level
+
+    ### Returns:
+    - compression (tuple): The zipfile compress type, and the compress level (None for stored entries)
+    """
+
+    if name.rsplit(".", 1)[-1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, FAST_COMPRESS_LEVEL if fast else COMPRESS_LEVEL
+
+def build_sb3(project_json: str, assets: dict, fast: bool = False) -> bytes:
+    """
+    Zips project.json and the project's assets into an sb3 file
+
+    ### Parameters:
+    - project_json (str): The serialized project data
+    - assets (dict): File name (e.g. "<md5>.png") --> file bytes
+    - fast (bool): (optional) Deflate with level 1 instead of COMPRESS_LEVEL
+
+    ### Returns:
+    - sb3 (bytes): The sb3 file
+    """
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zipf:
+        compress_type, compress_level = compression_for("project.json", fast)
+        zipf.writestr("project.json", project_json, compress_type=compress_type, compresslevel=compress_level)
+        for name, data in assets.items():
+            compress_type, compress_level = compression_for(name, fast)
+            zipf.writestr(name, data, compress_type=compress_type, compresslevel=compress_level)
+
+    return buffer.getvalue()
+
+def read_project(sb3) -> dict:
+    """
+    Reads project.json back out of an sb3 file
+
+    ### Parameters:
+    - sb3 (str | bytes): Path of the sb3 file, or the file itself
+
+    ### Returns:
+    - project_data (dict): The project data
+    """
+
+    with zipfile.ZipFile(io.BytesIO(sb3) if isinstance(sb3, bytes) else sb3) as zipf:
+        return json.loads(zipf.read("project.json"))
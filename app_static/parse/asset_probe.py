@@ -0,0 +1,314 @@
+"""
+Reads asset metadata straight from the files in memory (mostly from their headers), without decoding the whole file
+"""
+
+import re
+import struct
+import xml.etree.ElementTree as ElementTree
+
+import svgpathtools # type: ignore
+
+_LENGTH_RE = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(px)?\s*") # Lengths in user units (unitless or px)
+_CHUNK_SIZE = 4096 # Bytes fed to the xml parser at a time while looking for the root element
+
+def _png_size(data: bytes):
+    # 8 byte signature, then the IHDR chunk: length, b"IHDR", width, height (big endian)
+    if len(data) >= 24 and data[12:16] == b"IHDR":
+        return struct.unpack(">II", data[16:24])
+    return None
+
+def _jpeg_size(data: bytes):
+    # Walk the marker segments up to the first start of frame (SOFn) segment
+    idx = 2
+    while idx + 4 <= len(data):
+        if data[idx] != 0xFF:
+            return None
+        marker = data[idx + 1]
+        if marker == 0xFF: # Fill byte
+            idx += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7: # Markers without a segment
+            idx += 2
+            continue
+        if marker in (0xD9, 0xDA): # End of image / start of scan before any frame header
+            return None
+
+        length = struct.unpack(">H", data[idx + 2:idx + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC): # SOFn (not DHT, JPG or DAC)
+            if idx + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[idx + 5:idx + 9])
+            return width, height
+        idx += 2 + length
+    return None
+
+def _gif_size(data: bytes):
+    # Logical screen width and height (little endian) after the signature
+    if len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    return None
+
+def _bmp_size(data: bytes):
+    if len(data) < 26:
+        return None
+    header_size = struct.unpack("<I", data[14:18])[0]
+    if header_size == 12: # BITMAPCOREHEADER (OS/2)
+        width, height = struct.unpack("<HH", data[18:22])
+    else: # BITMAPINFOHEADER and later. Negative heights are top-down bitmaps
+        width, height = struct.unpack("<ii", data[18:26])
+    return abs(width), abs(height)
+
+def image_size(data: bytes):
+    """
+    Returns the dimensions of a PNG, JPEG, GIF or BMP image, read from its header
+
+    ### Parameters:
+    - data (bytes): The image file
+
+    ### Returns:
+    - size (tuple[int, int] | None): (width, height), None if the format is not recognized or the header is malformed
+    """
+
+    try:
+        if data.startswith(b"\x89PNG\r\n\x1a\n"):
+            return _png_size(data)
+        if data.startswith(b"\xff\xd8"):
+            return _jpeg_size(data)
+        if data.startswith((b"GIF87a", b"GIF89a")):
+            return _gif_size(data)
+        if data.startswith(b"BM"):
+            return _bmp_size(data)
+    except struct.error:
+        pass
+    return None
+
+def _svg_length(value):
+    """
+    Parses an svg length in user units. Returns None for missing, relative (%, em) or physical (cm, pt) lengths
+    """
+
+    if value is None:
+        return None
+    match = _LENGTH_RE.fullmatch(value)
+    return float(match.group(1)) if match else None
+
+def _svg_root(data: bytes):
+    """
+    Returns the attributes of the root element of an svg, parsing only up to its start tag
+    """
+
+    parser = ElementTree.XMLPullParser(events=("start",))
+    for idx in range(0, len(data), _CHUNK_SIZE):
+        parser.feed(data[idx:idx + _CHUNK_SIZE])
+        for _, element in parser.read_events():
+            return element.attrib
+    return None
+
+def svg_center(data: bytes):
+    """
+    Returns the rotation center of an svg costume: the center of its viewBox, or of its width and height.
+    Only when the root element has neither, the bounding box of all its paths is computed.
+
+    ### Parameters:
+    - data (bytes): The svg file
+
+    ### Returns:
+    - center (tuple[float, float]): (x, y) of the rotation center
+    """
+
+    try:
+        attributes = _svg_root(data)
+    except ElementTree.ParseError:
+        attributes = None # Let svgpathtools report the problem
+
+    if attributes is not None:
+        view_box = attributes.get("viewBox", "").replace(",", " ").split()
+        if len(view_box) == 4:
+            try:
+                width, height = float(view_box[2]), float(view_box[3])
+                if width > 0 and height > 0:
+                    return width / 2, height / 2
+            except ValueError:
+                pass
+
+        width = _svg_length(attributes.get("width"))
+        height = _svg_length(attributes.get("height"))
+        if width and height:
+            return width / 2, height / 2
+
+    # Full bounding box over every path
+    paths, _ = svgpathtools.svgstr2paths(data.decode("utf-8"))
+    boxes = [path.bbox() for path in paths if len(path)]
+    if not boxes:
+        return 0, 0
+    xmin = min(box[0] for box in boxes)
+    xmax = max(box[1] for box in boxes)
+    ymin = min(box[2] for box in boxes)
+    ymax = max(box[3] for box in boxes)
+    return (xmin + xmax) / 2, (ymin + ymax) / 2
+
+# MPEG audio tables, indexed by the version bits (3 = MPEG 1, 2 = MPEG 2, 0 = MPEG 2.5) and layer bits (3 = I, 2 = II, 1 = III)
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_MP3_BITRATES = { # kbit/s for bitrate indexes 1-14
+    (3, 3): (32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (3, 2): (32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (3, 1): (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 3): (32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 1): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+def _mp3_frame(data: bytes, idx: int):
+    """
+    Decodes the MPEG audio frame header at idx
+
+    ### Returns:
+    - frame (tuple | None): (frame length, samples per frame, sample rate, version, mono), None if there is no valid header at idx
+    """
+
+    if idx + 4 > len(data) or data[idx] != 0xFF or data[idx + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[idx + 1] >> 3) & 3
+    layer = (data[idx + 1] >> 1) & 3
+    bitrate_idx = data[idx + 2] >> 4
+    rate_idx = (data[idx + 2] >> 2) & 3
+    padding = (data[idx + 2] >> 1) & 1
+    mono = data[idx + 3] >> 6 == 3
+    if version == 1 or layer == 0 or bitrate_idx in (0, 15) or rate_idx == 3: # Reserved values (and free format)
+        return None
+
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_idx]
+    bitrate = _MP3_BITRATES[(3 if version == 3 else 2, layer)][bitrate_idx - 1] * 1000
+    if layer == 3: # Layer I
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, version, mono
+    if layer == 1 and version != 3: # Layer III, MPEG 2 / 2.5
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate, version, mono
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate, version, mono
+
+def _mp3_sync(data: bytes, idx: int):
+    """
+    Finds the first frame at or after idx: a header followed by another header (or the end of the file), so random 0xFF bytes are not mistaken for one
+
+    ### Returns:
+    - found (tuple | None): (index of the frame, the frame (see _mp3_frame)), None if there is no frame
+    """
+
+    while idx + 4 <= len(data):
+        frame = _mp3_frame(data, idx)
+        if frame and (idx + frame[0] >= len(data) or _mp3_frame(data, idx + frame[0])):
+            return idx, frame
+        idx += 1
+    return None
+
+def mp3_info(data: bytes):
+    """
+    Counts the samples of an MP3 exactly: from the Xing/Info or VBRI header if there is one, otherwise by walking every frame header
+
+    ### Parameters:
+    - data (bytes): The MP3 file
+
+    ### Returns:
+    - info (tuple[int, int] | None): (sample count, sample rate), None if no MPEG audio frame was found
+    """
+
+    # Skip ID3v2 tags
+    idx = 0
+    while data[idx:idx + 3] == b"ID3" and idx + 10 <= len(data):
+        size = (data[idx + 6] << 21) | (data[idx + 7] << 14) | (data[idx + 8] << 7) | data[idx + 9]
+        idx += 10 + size + (10 if data[idx + 5] & 0x10 else 0) # Footer flag
+
+    found = _mp3_sync(data, idx)
+    if found is None:
+        return None
+    idx, frame = found
+    length, samples, sample_rate, version, mono = frame
+
+    # VBR headers in the first frame already know the number of frames
+    side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+    xing = idx + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        if len(data) >= xing + 12 and data[xing + 7] & 1: # Frames flag
+            return struct.unpack(">I", data[xing + 8:xing + 12])[0] * samples, sample_rate
+        idx += length # No frame count. The header's frame has no audio, so the walk starts after it
+    elif data[idx + 36:idx + 40] == b"VBRI":
+        if len(data) >= idx + 54:
+            return struct.unpack(">I", data[idx + 50:idx + 54])[0] * samples, sample_rate
+        idx += length
+
+    # Walk the frames
+    frames = 0
+    while idx + 4 <= len(data):
+        frame = _mp3_frame(data, idx)
+        if not frame: # Junk between frames, find the next frame
+            found = _mp3_sync(data, idx + 1)
+            if found is None:
+                break
+            idx, frame = found
+        if idx + frame[0] > len(data): # Cut off last frame
+            break
+        frames += 1
+        idx += frame[0]
+    return frames * samples, sample_rate
+
+# WAV format tags
+_WAVE_PCM = 0x0001
+_WAVE_MS_ADPCM = 0x0002
+_WAVE_FLOAT = 0x0003
+_WAVE_IMA_ADPCM = 0x0011
+_WAVE_EXTENSIBLE = 0xFFFE
+
+def wav_info(data: bytes):
+    """
+    Reads the sample count and rate of a WAV file from its fmt, fact and data chunks. Supports PCM, float, and IMA/MS ADPCM.
+
+    ### Parameters:
+    - data (bytes): The WAV file
+
+    ### Returns:
+    - info (tuple[int, int] | None): (sample count, sample rate), None if the file is not a WAV file this can read
+    """
+
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+
+    fmt = None
+    fact = None
+    data_size = None
+    idx = 12
+    while idx + 8 <= len(data):
+        chunk_id = data[idx:idx + 4]
+        chunk_size = struct.unpack("<I", data[idx + 4:idx + 8])[0]
+        body = data[idx + 8:idx + 8 + chunk_size]
+        if chunk_id == b"fmt " and len(body) >= 16:
+            fmt = body
+        elif chunk_id == b"fact" and len(body) >= 4:
+            fact = struct.unpack("<I", body[:4])[0]
+        elif chunk_id == b"data":
+            data_size = len(body) # Truncated files only count the samples they actually have
+        idx += 8 + chunk_size + (chunk_size & 1) # Chunks are padded to an even size
+
+    if fmt is None or data_size is None:
+        return None
+
+    format_tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if channels == 0 or block_align == 0:
+        return None
+
+    if format_tag in (_WAVE_PCM, _WAVE_FLOAT, _WAVE_EXTENSIBLE):
+        return data_size // block_align, sample_rate
+
+    if format_tag in (_WAVE_IMA_ADPCM, _WAVE_MS_ADPCM):
+        if fact is not None: # Exact count written by the encoder
+            return fact, sample_rate
+        if len(fmt) < 20:
+            return None
+        samples_per_block = struct.unpack("<H", fmt[18:20])[0]
+        full_blocks, remainder = divmod(data_size, block_align)
+        sample_count = full_blocks * samples_per_block
+        if format_tag == _WAVE_IMA_ADPCM and remainder > 4 * channels: # 4 byte header per channel (1 sample), then 4 bit samples
+            sample_count += 1 + (remainder - 4 * channels) * 8 // (bits * channels)
+        elif format_tag == _WAVE_MS_ADPCM and remainder > 7 * channels: # 7 byte header per channel (2 samples), then 4 bit samples
+            sample_count += 2 + (remainder - 7 * channels) * 2 // channels
+        return sample_count, sample_rate
+
+    return (fact, sample_rate) if fact is not None else None
@@ -0,0 +1,253 @@
+"""
+Content-addressed store of costume and sound assets. Keeps the decoded bytes and the computed metadata of recently used assets,
+so repeated assets (across sprites and compiles) are decoded and probed only once
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import io
+import os
+import threading
+from typing import NamedTuple
+
+# Asset details
+import asset_probe
+from PIL import Image
+import wave
+
+# Maximum total size (in bytes) of the stored assets
+MAX_BYTES = int(os.environ.get("KATNIP_ASSET_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Threads decoding and probing assets at the same time (decoding, hashing and PIL mostly run outside the GIL)
+THREADS = int(os.environ.get("KATNIP_ASSET_THREADS", min(8, os.cpu_count() or 1)))
+
+# Mime type --> file extension
+MIME_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/bmp": "bmp",
+    "image/svg+xml": "svg",
+    "audio/mpeg": "mp3",
+    "audio/wav": "wav"
+}
+
+class Asset(NamedTuple):
+    md5: str            # MD5 hash of the bytes (the asset id)
+    ext: str            # File extension ("png", "svg", "wav", ... or "bin" if unsupported)
+    data: bytes         # The decoded file
+    info: tuple | None  # Costumes: rotation center (x, y). Sounds: (sample count, sample rate). None if the type is unsupported
+
+    @property
+    def file(self):
+        """The asset's file name inside the sb3 ("<md5>.<ext>")"""
+        return f"{self.md5}.{self.ext}"
+
+def _getWav(data: bytes):
+    """
+    Gets the WAV file data from the file's bytes, using the wave module (fallback for files asset_probe can't read).
+
+    ### Parameters:
+    - data (bytes): The WAV file
+
+    ### Returns:
+    - data (tuple): The WAV file data
+        - data[0]: Sample count
+        - data[1]: Sample rate
+    """
+
+    with wave.open(io.BytesIO(data), 'rb') as wav_file:
+        # Get the sample rate (fps)
+        sample_rate = wav_file.getframerate()
+
+        # Get the number of frames (samples)
+        sample_count = wav_file.getnframes()
+
+    return sample_count, sample_rate
+
+def _getMp3(data: bytes):
+    """
+    Gets the MP3 file data from the file's bytes, using mutagen (fallback for files asset_probe can't read).
+
+    ### Parameters:
+    - data (bytes): The MP3 file
+
+    ### Returns:
+    - data (tuple): The MP3 file data
+        - data[0]: Sample count
+        - data[1]: Sample rate
+    """
+
+    from mutagen.mp3 import MP3 # Only imported when needed
+    audio = MP3(io.BytesIO(data))
+    sample_rate = audio.info.sample_rate
+    duration = audio.info.length
+    sample_count = int(sample_rate * duration) # Estimate but eh
+
+    return sample_count, sample_rate
+
+def _probe(ext: str, data: bytes):
+    """
+    Computes the metadata of an asset
+
+    ### Parameters:
+    - ext (str): File extension of the asset
+    - data (bytes): The asset's bytes
+
+    ### Returns:
+    - info (tuple | None): Rotation center for costumes, (sample count, sample rate) for sounds, None if the type is unsupported
+    """
+
+    match ext:
+        case ext if ext in ["png", "jpg", "gif", "bmp"]:
+            size = asset_probe.image_size(data)
+            if size is None: # Unusual header, let PIL figure it out
+                image = Image.open(io.BytesIO(data))
+                size = image.size
+            return (size[0] // 2, size[1] // 2)
+        case "svg":
+            return asset_probe.svg_center(data)
+        case "mp3":
+            return asset_probe.mp3_info(data) or _getMp3(data)
+        case "wav":
+            return asset_probe.wav_info(data) or _getWav(data)
+        case _:
+            return None
+
+class asset_store():
+    """
+    LRU store of assets keyed by MD5 and file extension, bounded by the total size of the stored bytes. Safe to share between threads.
+    Data urls are indexed too, so a data url seen before skips the base64 decode as well.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        """
+        ### Parameters:
+        - max_bytes (int): (optional) Maximum total size of the stored assets
+        """
+
+        self.max_bytes = max_bytes
+        self.assets = OrderedDict() # (MD5, ext) --> Asset (least recently used first). The same bytes under another mime type are another asset
+        self.urls = {} # Hash of a data url --> (MD5, ext) of its asset
+        self.url_keys = {} # (MD5, ext) --> hashes of the data urls of the asset (to forget them when the asset is evicted)
+        self.size = 0 # Total size of the stored assets
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decoded_bytes = 0 # Total size of the assets decoded from data urls
+        self.lock = threading.Lock()
+
+    def load(self, data_url: str) -> Asset:
+        """
+        Returns the asset of a data url, decoding and probing it only if it is not stored yet
+
+        ### Parameters:
+        - data_url (str): The data url of the asset (e.g. "data:image/png;base64,...")
+
+        ### Returns:
+        - asset (Asset): The asset with its metadata
+        """
+
+        url_key = hashlib.md5(data_url.encode("utf-8")).digest()
+        with self.lock:
+            asset = self.assets.get(self.urls.get(url_key))
+            if asset is not None:
+                self.assets.move_to_end((asset.md5, asset.ext))
+                self.hits += 1
+                return asset
+
+        # Extract stuff from the data url
+        header, encoded = data_url.split(",", 1)
+        mime_type = header.split(";")[0].split(":")[1]
+        ext = MIME_EXTENSIONS.get(mime_type, "bin")
+
+        # Decode b64 data, and hash the data MD5
+        data = base64.b64decode(encoded)
+        md5_hash = hashlib.md5(data).hexdigest()
+
+        with self.lock:
+            asset = self.assets.get((md5_hash, ext))
+        if asset is None:
+            asset = Asset(md5_hash, ext, data, _probe(ext, data))
+
+        with self.lock:
+            self.misses += 1
+            self.decoded_bytes += len(data)
+            self._add(url_key, asset)
+        return asset
+
+    def load_many(self, data_urls: list) -> dict:
+        """
+        Starts loading assets on the shared thread pool. Each distinct data url is loaded once.
+
+        ### Parameters:
+        - data_urls (list[str]): The data urls to load
+
+        ### Returns:
+        - loads (dict): Data url --> Future of its Asset (result() raises any error of the load)
+        """
+
+        pool = _get_pool()
+        loads = {}
+        for data_url in data_urls:
+            if data_url not in loads:
+                loads[data_url] = pool.submit(self.load, data_url)
+        return loads
+
+    def _add(self, url_key: bytes, asset: Asset):
+        """
+        Stores an asset (lock must be held), evicting the least recently used assets until the store fits in max_bytes
+        """
+
+        if len(asset.data) > self.max_bytes: # Would evict everything else and still not fit
+            return
+
+        key = (asset.md5, asset.ext)
+        self.urls[url_key] = key
+        self.url_keys.setdefault(key, set()).add(url_key)
+        if key in self.assets:
+            self.size -= len(self.assets.pop(key).data)
+        self.assets[key] = asset
+        self.size += len(asset.data)
+
+        while self.size > self.max_bytes:
+            key, evicted = self.assets.popitem(last=False)
+            self.size -= len(evicted.data)
+            self.evictions += 1
+            for evicted_url in self.url_keys.pop(key):
+                del self.urls[evicted_url]
+
+    def stats(self) -> dict:
+        """
+        Returns the store counters (for sizing the store)
+
+        ### Returns:
+        - stats (dict): hits, misses, evictions, entries, bytes, max_bytes and decoded_bytes
+        """
+
+        with self.lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "entries": len(self.assets),
+                    "bytes": self.size,
+                    "max_bytes": self.max_bytes,
+                    "decoded_bytes": self.decoded_bytes}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide asset thread pool, creating it on first use (so it is created after any fork)
+    """
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="katnip-assets")
+        return _pool
+
+store = asset_store() # Process-wide asset store
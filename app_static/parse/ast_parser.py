@@ -0,0 +1,447 @@
+"""
+Parser turning Katnip tokens into a syntax tree (scripts, statements, expressions and procedure definitions)
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+import hashlib
+import re
+import threading
+
+import command_manager
+import lexer
+import timings
+
+_NUMBER_RE = re.compile(r"[-.0-9]+")
+
+CACHE_SIZE = 128 # Maximum number of parsed programs kept in memory
+
+# Parsed programs, keyed by (commands version, hash of the source). Trees are immutable, so they are safe to share between compiles
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Expressions
+
+@dataclass(frozen=True, slots=True)
+class Literal:
+    kind: str  # "str" or "num"
+    value: str # The value (strings without their quotes)
+    text: str  # Source text of the argument (without whitespace)
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class Variable:
+    name: str
+    text: str
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class ListRef:
+    name: str
+    text: str
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class ProcArg:
+    name: str # Name of the argument of the procedure being defined (a.name)
+    text: str
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class Call:
+    name: str    # Name of the reporter
+    args: tuple  # Argument expressions
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class Invalid:
+    text: str # An argument that is none of the above (reported when the block is generated)
+    line: int
+
+# Statements
+
+@dataclass(frozen=True, slots=True)
+class Statement:
+    name: str              # Name of the command
+    args: tuple            # Argument expressions
+    comment: str | None
+    line: int
+    substacks: tuple | None = None # C-blocks: the statements of each substack (a second one for "else")
+
+@dataclass(frozen=True, slots=True)
+class ProcCall:
+    name: str     # Name of the procedure (without "fn.")
+    args: tuple   # (argument name, expression) pairs
+    comment: str | None
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class ProcDef:
+    name: str     # Name of the procedure (without "func:")
+    params: tuple # Parameter texts, e.g. ("warp:true", "x[exp]")
+    comment: str | None
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class Script:
+    statements: tuple # Top level statements, chained into one stack (a ProcDef starts a new chain)
+    closed: bool      # Whether the script ended with a '}' (starts a new stack column)
+    line: int
+
+@dataclass(frozen=True, slots=True)
+class Program:
+    scripts: tuple
+
+class _parser():
+    """
+    Parses the lines of one program. Every line is visited once: c-blocks consume their own body lines instead of copying them.
+    """
+
+    def __init__(self, source: str, context, timer=timings.NO_TIMER):
+        """
+        ### Parameters:
+        - source (str): The program's source code
+        - context (error_handler.CompileContext): Receives parse errors
+        - timer (timings.stage_timer): (optional) Times the source splitting
+        """
+
+        self.context = context
+        with timer.span("split"):
+            self.lines = lexer.split_lines(lexer.tokenize(source))
+        self.idx = 0 # Index of the current line
+
+    def _split_comment(self, line: list):
+        """
+        Seperates the comment token from the code tokens of a line.
+
+        ### Returns:
+        - line (tuple): The two split pieces of the line:
+            - code (list[lexer.Token]): The code tokens
+            - comment (str | None): The comment
+        """
+
+        if line and line[-1].kind == lexer.COMMENT:
+            return line[:-1], line[-1].text[1:].strip()
+        return line, None
+
+    def _flags(self, code: list):
+        """
+        Returns whether the code tokens contain a '{', a '}' and an 'else'
+        """
+
+        opens = closes = has_else = False
+        for token in code:
+            if token.kind == lexer.LBRACE:
+                opens = True
+            elif token.kind == lexer.RBRACE:
+                closes = True
+            elif token.kind == lexer.ELSE:
+                has_else = True
+        return opens, closes, has_else
+
+    def parse_program(self):
+        """
+        Parses the whole program. Top level '}' lines end the current script.
+
+        ### Returns:
+        - program (Program): The syntax tree of the program
+        """
+
+        scripts = []
+        statements = []
+        script_line = None
+        while self.idx < len(self.lines):
+            code, comment = self._split_comment(self.lines[self.idx])
+            if not code: # Empty line or comment line
+                self.idx += 1
+                continue
+
+            if script_line is None:
+                script_line = code[0].line
+
+            # Exiting hat block
+            if self._flags(code)[1]:
+                scripts.append(Script(tuple(statements), True, script_line))
+                statements = []
+                script_line = None
+                self.idx += 1
+                continue
+
+            statements.append(self._parse_statement(code, comment))
+
+        if statements:
+            scripts.append(Script(tuple(statements), False, script_line))
+
+        return Program(tuple(scripts))
+
+    def _parse_statement(self, code: list, comment):
+        """
+        Parses the statement on the current line (and the body of c-blocks), moving past it.
+
+        ### Parameters:
+        - code (list[lexer.Token]): The code tokens of the current line
+        - comment (str | None): The comment of the current line
+
+        ### Returns:
+        - statement (Statement | ProcCall | ProcDef): The parsed statement
+        """
+
+        statement, c_block = self._parse_line(code, comment)
+        if c_block:
+            return self._parse_substacks(statement)
+        return statement
+
+    def _parse_line(self, code: list, comment):
+        """
+        Parses the statement on the current line only, moving past the line.
+
+        ### Returns:
+        - statement (Statement | ProcCall | ProcDef): The parsed statement (c-blocks without their substacks)
+        - c_block (bool): Whether the statement is a c-block, whose body follows on the next lines
+        """
+
+        line = code[0].line
+        self.idx += 1
+
+        match, parens = self._match_parens(code)
+        name, arg_ranges = self._split_call(code, 0, len(code), match)
+
+        # Process function calls
+        if name.startswith("fn."):
+            args = []
+            for start, end in arg_ranges:
+                # Argument format --> argName:value
+                colon = next((idx for idx in range(start, end) if code[idx].kind == lexer.COLON), -1)
+                if colon == -1:
+                    self.context.add_error(f"⁉️🧩 - No value/argument name provided. ':' not found for argument '{lexer.glue(code[start:end])}' for procedure call of '{name[3:]}'", name[3:], line)
+                    self.context.throw_errors()
+                args.append((lexer.glue(code[start:colon]), self._parse_expr(code, colon + 1, end, match, parens)))
+            return ProcCall(name[3:], tuple(args), comment, line), False
+
+        # Process function definitions
+        if name.startswith("func:"):
+            return ProcDef(name[5:], tuple(lexer.glue(code[start:end]) for start, end in arg_ranges), comment, line), False
+
+        args = tuple(self._parse_expr(code, start, end, match, parens) for start, end in arg_ranges)
+
+        command = command_manager.read_by_name(name)
+        return Statement(name, args, comment, line), bool(command and command["type"] == "c")
+
+    def _parse_substacks(self, statement: Statement):
+        """
+        Parses the body of a c-block, up to (and including) its closing '}'. "} else {" starts the second substack.
+        C-blocks inside the body are pushed onto a list of open blocks rather than parsed by a nested call, so any nesting depth fits in memory.
+
+        ### Parameters:
+        - statement (Statement): The c-block (without its substacks)
+
+        ### Returns:
+        - statement (Statement): The c-block with the statements of each substack
+        """
+
+        # Open c-blocks, innermost last: [statement, substacks, extra_depth]
+        # extra_depth counts the '{' opened by lines that are not c-blocks (their '}' lines are skipped)
+        blocks = [[statement, [[]], 0]]
+        while self.idx < len(self.lines):
+            block = blocks[-1]
+            substacks = block[1]
+            code, comment = self._split_comment(self.lines[self.idx])
+            if not code:
+                self.idx += 1
+                continue
+
+            opens, closes, has_else = self._flags(code)
+
+            if has_else and block[2] == 0: # Else condition found
+                if len(substacks) == 2:
+                    self.context.add_error("⁉️ - Unexpected 'else'. A c-block can only have one else", lexer.glue(code), code[0].line)
+                    self.context.throw_errors()
+                substacks.append([])
+                self.idx += 1
+                continue
+
+            if closes and not opens:
+                self.idx += 1
+                if block[2] > 0:
+                    block[2] -= 1
+                    continue
+                # If there is an else statement on the next line (and no else yet), continue.
+                # A "} else {" line closes an enclosing block first, so its else belongs to that block
+                if len(substacks) == 1 and self.idx < len(self.lines):
+                    _, next_closes, next_else = self._flags(self._split_comment(self.lines[self.idx])[0])
+                    if next_else and not next_closes:
+                        continue
+
+                # Closing } found
+                finished = replace(block[0], substacks=tuple(tuple(statements) for statements in substacks))
+                blocks.pop()
+                if not blocks:
+                    return finished
+                blocks[-1][1][-1].append(finished)
+                continue
+
+            statement, c_block = self._parse_line(code, comment)
+            if c_block:
+                blocks.append([statement, [[]], 0])
+                continue
+            if opens:
+                block[2] += 1 # e.g. a hat block inside a c-block
+            substacks[-1].append(statement)
+
+        # End of file without running into a closing }
+        self.context.add_error("⁉️ - Unexpected end of code block. Expected '}'", "", blocks[-1][0].line)
+        self.context.throw_errors()
+
+    def _match_parens(self, code: list):
+        """
+        Matches parentheses in one pass.
+
+        ### Returns:
+        - match (dict): Index of each '(' --> index of its ')' (len(code) if it is never closed)
+        - parens (list[tuple[int, int]]): Number of '(' and ')' before each token index, so any token range can be checked for parentheses at once
+        """
+
+        match = {}
+        stack = []
+        parens = [(0, 0)]
+        opened = closed = 0
+        for idx, token in enumerate(code):
+            if token.kind == lexer.LPAREN:
+                stack.append(idx)
+                opened += 1
+            elif token.kind == lexer.RPAREN:
+                if stack:
+                    match[stack.pop()] = idx
+                closed += 1
+            parens.append((opened, closed))
+        for idx in stack:
+            match[idx] = len(code)
+        return match, parens
+
+    def _split_call(self, code: list, start: int, end: int, match: dict):
+        """
+        Splits the tokens of a call into its name and the token ranges of its arguments.
+
+        ### Parameters:
+        - code (list[lexer.Token]): Tokens of the line
+        - start, end (int): Token range of the call
+        - match (dict): Matching parentheses of the line
+
+        ### Returns:
+        - name (str): The name of the call (everything before the first '(')
+        - arg_ranges (list[tuple[int, int]]): Token range of each (non-empty) argument
+        """
+
+        open_idx = start
+        while open_idx < end and not code[open_idx].kind == lexer.LPAREN:
+            open_idx += 1
+        name = lexer.glue(code[start:open_idx])
+        if open_idx == end:
+            return name, []
+
+        close_idx = min(match[open_idx], end)
+        arg_ranges = []
+        arg_start = idx = open_idx + 1
+        while idx < close_idx:
+            kind = code[idx].kind
+            if kind == lexer.LPAREN:
+                idx = match[idx] # Skip nested parentheses
+            elif kind == lexer.COMMA:
+                if idx > arg_start:
+                    arg_ranges.append((arg_start, idx))
+                arg_start = idx + 1
+            idx += 1
+        if close_idx > arg_start:
+            arg_ranges.append((arg_start, close_idx))
+
+        return name, arg_ranges
+
+    def _parse_expr(self, code: list, start: int, end: int, match: dict, parens: list):
+        """
+        Parses the argument in the given token range.
+        Uses a work list instead of recursion: a call's arguments are parsed first, then the call is built from them. Each token range is visited once, whatever the depth.
+
+        ### Parameters:
+        - code (list[lexer.Token]): Tokens of the line
+        - start, end (int): Token range of the argument
+        - match, parens: Matching parentheses and parentheses counts of the line (see _match_parens)
+
+        ### Returns:
+        - expr (Literal | Variable | ListRef | ProcArg | Call | Invalid): The argument's expression
+        """
+
+        work = [(start, end)] # Token ranges to parse, and calls to build once their arguments are parsed: (name, number of arguments, line)
+        results = [] # Parsed expressions (the parsed arguments of unfinished calls, in order)
+        while work:
+            item = work.pop()
+            if len(item) == 3: # Arguments of the call are parsed
+                name, count, line = item
+                args = tuple(results[len(results) - count:])
+                del results[len(results) - count:]
+                results.append(Call(name, args, line))
+                continue
+
+            start, end = item
+            line = code[start].line if start < end else code[-1].line
+            kind = code[start].kind if start < end else None
+
+            if kind in (lexer.VAR, lexer.LIST, lexer.ARG, lexer.STRING, lexer.NUMBER) or kind is None:
+                text = lexer.glue(code[start:end]) # Whitespace is ignored outside strings
+                if kind == lexer.VAR:
+                    results.append(Variable(text[1:], text, line))
+                    continue
+                if kind == lexer.LIST:
+                    results.append(ListRef(text[1:], text, line))
+                    continue
+                if kind == lexer.ARG:
+                    results.append(ProcArg(text[2:], text, line))
+                    continue
+                if kind == lexer.STRING:
+                    results.append(Literal("str", text[1:-1], text, line))
+                    continue
+                if kind == lexer.NUMBER and _NUMBER_RE.fullmatch(text):
+                    results.append(Literal("num", text, text, line))
+                    continue
+
+            if parens[end][0] > parens[start][0] and parens[end][1] > parens[start][1]: # Contains a '(' and a ')'
+                name, arg_ranges = self._split_call(code, start, end, match)
+                work.append((name, len(arg_ranges), line))
+                work.extend(reversed(arg_ranges)) # First argument on top, so the arguments are parsed in order
+                continue
+
+            results.append(Invalid(lexer.glue(code[start:end]), line))
+
+        return results[0]
+
+def parse(source: str, context, cache: bool = True, timer=timings.NO_TIMER):
+    """
+    Parses Katnip source code into a syntax tree.
+    Results are cached (least recently used programs are dropped first), so the same program is only parsed once per command set.
+
+    ### Parameters:
+    - source (str): The program's source code
+    - context (error_handler.CompileContext): Receives parse errors
+    - cache (bool): (optional) Use the cache. Benchmarks turn it off to time the parse itself
+    - timer (timings.stage_timer): (optional) Times the source splitting (of programs that are not cached)
+
+    ### Returns:
+    - program (Program): The syntax tree of the program
+    """
+
+    if not cache:
+        return _parser(source, context, timer).parse_program()
+
+    key = (command_manager.version(), hashlib.sha256(source.encode("utf-8")).digest())
+    with _cache_lock:
+        tree = _cache.get(key)
+        if tree is not None:
+            _cache.move_to_end(key)
+            return tree
+
+    tree = _parser(source, context, timer).parse_program() # Programs with errors raise here, and are never cached
+
+    with _cache_lock:
+        _cache[key] = tree
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return tree
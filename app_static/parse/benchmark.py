@@ -0,0 +1,147 @@
+"""
+Compiler benchmark: compiles every script of a directory many times, and reports the time, blocks per second and peak memory of each compile stage.
+Results are written as json, so runs can be compared across commits (--compare).
+
+Usage (from the repository root):
+    python app_static/parse/benchmark.py -n 50 -o benchmark.json
+    python app_static/parse/benchmark.py -o new.json --compare benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import command_manager
+import error_handler
+import hierarchy
+import main_parser
+import run
+import timings
+
+STAGES = ["split", "parse", "generate", "simplify_args", "create_block", "procedure_fixups", "assets", "json", "hierarchy", "zip"] # See project.stage_timings(). generate is the rest of the block generation
+
+def compile_once(code: str, memory: bool = False):
+    """
+    Compiles a script once, timing every stage. The parse cache is bypassed, so the parse is timed too
+
+    ### Parameters:
+    - code (str): The script
+    - memory (bool): (optional) Record the peak memory of every stage instead (tracemalloc must be tracing)
+
+    ### Returns:
+    - timer (timings.stage_timer): The recorded stages
+    - blocks (int): Number of blocks generated
+    """
+
+    timer = timings.stage_timer(memory)
+    project_parser = main_parser.project(output=False, timer=timer, parse_cache=False)
+
+    project_parser.process_scrtxt(run.default_content(code), processes=0)
+    with timer.span("hierarchy"):
+        hierarchy.gen_hierarchy(project_parser.data)
+    project_parser.build()
+
+    return timer, sum(len(target["blocks"]) for target in project_parser.data["targets"])
+
+def bench_script(code: str, iterations: int):
+    """
+    Benchmarks one script
+
+    ### Parameters:
+    - code (str): The script
+    - iterations (int): Number of timed compiles (after one warm-up compile)
+
+    ### Returns:
+    - result (dict): Blocks and per-stage mean_ms, min_ms, blocks_per_s and peak_bytes
+    """
+
+    _, blocks = compile_once(code) # Warm-up (imports, caches)
+    samples = {stage: [] for stage in STAGES + ["total"]}
+    for _ in range(iterations):
+        timer, _ = compile_once(code)
+        for stage in STAGES:
+            samples[stage].append(timer.times[stage])
+        samples["total"].append(sum(timer.times.values()))
+
+    # Memory is measured in a separate compile, since tracing slows everything down
+    tracemalloc.start()
+    try:
+        timer, _ = compile_once(code, memory=True)
+    finally:
+        tracemalloc.stop()
+    peaks = dict(timer.peaks)
+    peaks["total"] = max(peaks.values())
+
+    stages = {}
+    for stage, values in samples.items():
+        mean = statistics.fmean(values)
+        stages[stage] = {"mean_ms": round(mean * 1000, 4),
+                         "min_ms": round(min(values) * 1000, 4),
+                         "blocks_per_s": round(blocks / mean) if mean else None,
+                         "peak_bytes": peaks.get(stage, 0)}
+    return {"blocks": blocks, "stages": stages}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _print_table(name: str, result: dict, baseline: dict = None):
+    print(f"\n📄 - {name} ({result['blocks']} blocks)")
+    for stage, values in result["stages"].items():
+        line = f"    {stage:<16} {values['mean_ms']:10.3f} ms  (min {values['min_ms']:9.3f})  {values['blocks_per_s'] or 0:>12,} blocks/s  {values['peak_bytes'] / 1024:10.1f} KiB peak"
+        if baseline and stage in baseline["stages"] and baseline["stages"][stage]["mean_ms"]:
+            line += f"  {values['mean_ms'] / baseline['stages'][stage]['mean_ms']:6.2f}x"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compile stages over a directory of scripts")
+    parser.add_argument("paths", nargs="*", default=[os.path.join("app_static", "scripts")], help="scripts, directories or glob patterns (default: app_static/scripts)")
+    parser.add_argument("-n", "--iterations", type=int, default=20, help="timed compiles per script (default: %(default)s)")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="json file for the results (default: %(default)s)")
+    parser.add_argument("--compare", help="results of an earlier run, to print the time ratio of every stage against")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.loads(f.read())["scripts"]
+
+    results = {"meta": {"commit": _git_commit(),
+                        "compiler_version": main_parser.COMPILER_VERSION,
+                        "commands_version": command_manager.version(),
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "log_level": error_handler.log_level,
+                        "iterations": args.iterations,
+                        "time": time.time()},
+               "scripts": {}}
+
+    for source in run.find_sources(args.paths):
+        name = os.path.basename(source)
+        with open(source, "r", encoding="utf-8") as f:
+            code = f.read()
+        try:
+            result = bench_script(code, args.iterations)
+        except error_handler.CmdError as e:
+            results["scripts"][name] = {"error": e.message}
+            print(f"\n❌ - {name}: {e.message}")
+            continue
+        result["lines"] = len(code.splitlines())
+        results["scripts"][name] = result
+        _print_table(name, result, baseline.get(name) if baseline else None)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(json.dumps(results, indent=1))
+    print(f"\n💾 - Results written to [{args.output}]")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
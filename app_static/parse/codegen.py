@@ -0,0 +1,1052 @@
+"""
+Code generation: turns parsed programs (ast_parser trees) into Scratch block json
+"""
+
+import json
+
+import command_manager
+import error_handler
+import ast_parser
+import font_width
+import timings
+
+def _run_frames(frame):
+    """
+    Runs a generator frame that yields a new frame (generator) wherever it would recurse, and gets that frame's return value sent back.
+    The frames live on a list rather than the Python call stack, so the recursion limit doesn't apply.
+
+    ### Parameters:
+    - frame (generator): The outermost frame
+
+    ### Returns:
+    - result: The return value of the outermost frame
+    """
+
+    frames = [frame]
+    result = None
+    while True:
+        try:
+            nested = frames[-1].send(result)
+        except StopIteration as done:
+            frames.pop()
+            if not frames:
+                return done.value
+            result = done.value
+            continue
+        frames.append(nested)
+        result = None
+
+class generator():
+    """
+    Walks syntax trees and emits the blocks of each target. Owns everything shared between the targets of one project:
+    symbol tables (variables, lists, broadcasts, procedures), unique ids and the block layout.
+    """
+
+    def __init__(self, context):
+        """
+        ### Parameters:
+        - context (error_handler.CompileContext): The context of the compile (errors and log)
+        """
+
+        self.context = context
+
+        # Project block positioning
+        self.stacks = 0
+        self.stack_height = 0
+        self.stack_width = 0
+        self.stack_spacing = 600 # The x-tiling spacing between stacks
+        self.comment_offset = 25 # The offset between the block + comment
+        self.line = 0 # For tracking line numbers for error messages
+
+        # Project json pieces
+        self.procedures = {} # The list of custom procedures made within the project.
+        self.curProc = "" # Currently evaluated procedure name for getting argument data
+        self.procRequests = {} # Used to keep track of "orders" for proc data
+
+        self.id_list = {} # The list to keep track of unique ID numbers for each type
+        self.variables = dict() # List of all variables
+        self.lists = dict() # List of all lists
+        self.broadcasts = dict() # List of all broadcast
+        self.monitors = list() # List of all monitors (variable/list monitors)
+
+    def generate(self, target: dict, tree: ast_parser.Program):
+        """
+        Generates the blocks of a parsed program, adding them to the target.
+
+        ### Parameters:
+        - target (dict): The target (sprite or stage) json receiving the blocks
+        - tree (ast_parser.Program): The parsed program
+        """
+
+        self.target = target
+        self.line = 0 # Set line num to 0 (reset line counter)
+
+        # Generate the blocks of each script
+        for script in tree.scripts:
+            self._generate(script.statements)
+
+            # Exiting hat block
+            if script.closed:
+                self.stacks += 1 # Increase number of stacks
+                self.stack_height = 0 # Reset stack height
+                self.curProc = "" # Reset current procedure
+
+    def time_stages(self, timer):
+        """
+        Times the parts of the block generation as stages of the timer: simplify_args, create_block and procedure_fixups
+
+        ### Parameters:
+        - timer (timings.stage_timer): The timer of the compile
+        """
+
+        self._simplify_args = timer.wrap("simplify_args", self._simplify_args)
+        self._create_block = timer.wrap("create_block", self._create_block)
+        self._fix_proc_requests = timer.wrap("procedure_fixups", self._fix_proc_requests)
+
+    def check_procedures(self):
+        """
+        Makes sure all procedures used were all defined, throwing errors for the ones that were not
+        """
+
+        for procedure in self.procedures:
+            if not self.procedures[procedure]["defined"]:
+                self.context.add_error(f"❓🤷‍♂️ - Procedure '{procedure}' not defined.", procedure, -1)
+        self.context.throw_errors()
+
+    def merge(self, target: dict, compiled: dict):
+        """
+        Adds the blocks of a target compiled by compile_target() (in another process) to the target, renumbering them as if they were
+        generated here: global variables, lists and broadcasts are unified, and block, comment and argument ids continue this generator's counters.
+        Merging the targets in order gives the same project as generating them in order.
+
+        ### Parameters:
+        - target (dict): The target (sprite or stage) json receiving the blocks
+        - compiled (dict): The result of compile_target() for the target's program
+        """
+
+        ids = {} # Id in the compiled target --> id in this project
+
+        # Symbols are looked up (or created) in order of first use, just like the serial compile does
+        for name, local_id in compiled["variables"].items():
+            ids[local_id] = self._read_variable(name)
+        for name, local_id in compiled["lists"].items():
+            ids[local_id] = self._read_list(name)
+        for name, local_id in compiled["broadcasts"].items():
+            ids[local_id] = self._read_broadcast(name)
+
+        # Counters of the other ids continue from this generator's counters
+        for arg, count in compiled["id_list"].items():
+            if arg in ("var", "list", "broadcast"):
+                continue
+            offset = self.id_list.get(arg, 0)
+            for num in range(1, count + 1):
+                ids[f"{arg}-{num}"] = f"{arg}-{offset + num}"
+            self.id_list[arg] = offset + count
+
+        for block_id, block in compiled["blocks"].items():
+            target["blocks"][ids[block_id]] = _renumber_block(block, ids)
+        for comment_id, comment in compiled["comments"].items():
+            target["comments"][ids[comment_id]] = {key: ids[value] if key == "blockId" else value for key, value in comment.items()}
+
+        self.stacks = compiled["stacks"]
+
+    def _generate_id(self, arg=None):
+        """
+        Generates a unique ID. This can be for anything needing an ID.
+
+        ### Parameters:
+        - arg (str | None): optional, is added to the unique ID's name to denote certain aspects.
+            (e.g. "var" or "broadcast", etc.)
+
+        ### Returns:
+        - str: The unique ID
+        """
+
+        if not arg:
+            arg = "block"
+        if arg in self.id_list:
+            self.id_list[arg] += 1
+        else:
+            self.id_list[arg] = 1
+        
+        my_id = self.id_list[arg]
+        return f"{arg}-{my_id}"
+       
+    def _read_variable(self, name: str):
+        """
+        Returns the id of a variable. Creates the variable + monitor if it does not exist.
+
+        ### Parameters:
+        - name (str): The name of the variable
+
+        ### Returns:
+        - str: The id of the variable
+        """
+
+        if not name in self.variables:
+            self.variables[name] = self._generate_id(arg="var")
+            self.monitors.append({
+                "id": self.variables[name],
+                "mode": "default",
+                "opcode": "data_variable",
+                "params": {"VARIABLE": name},
+                "spriteName": None,
+                "value": 0,
+                "x": 5,
+                "y": 5 + len(self.monitors) * 27,
+                "width": 0,
+                "height": 0,
+                "visible": False,
+                "sliderMin": 0,
+                "sliderMax": 100,
+                "isDescrete": True
+            })
+        return self.variables[name]
+    
+    def _read_list(self, name: str):
+        """
+        Returns the id of a list. Creates the list if it does not exist.
+
+        ### Parameters:
+        - name (str): The name of the list
+
+        ### Returns:
+        - str: The id of the list
+        """
+
+        if not name in self.lists:
+            self.lists[name] = self._generate_id(arg="list")
+        return self.lists[name]
+    
+    def _read_broadcast(self, name: str):
+        """
+        Returns the id of a broadcast. Creates the broadcast if it does not exist.
+
+        ### Parameters:
+        - name (str): The name of the broadcast
+
+        ### Returns:
+        - str: The id of the broadcast
+        """
+
+        if not name in self.broadcasts:
+            self.broadcasts[name] = self._generate_id(arg="broadcast")
+        return self.broadcasts[name]
+    
+    def _read_procedure(self, name: str, args: list = [], warp: str = "false", definition: bool = False, call_args: dict = {}):
+        """
+        Returns the details of a custom procedure. Creates the procedure if it does not exist.
+
+        Example call:
+        _read_procedure("myProcedure", [{"name": "myArgument", "type": "bool"}, {"name": "anotherArgument", "type": "exp"}], warp="true", definition="true")
+        or
+        _read_procedure("myProcedure")
+        
+        ### Parameters:
+        - name (str): The procedure name to be created/read
+        - args (list): (optional) The arguments for the procedure containing dictionaries for arguments:
+            - arg (dict): The arguments for the procedure
+                - arg["name"]: The name for the argument
+                - arg["type"]: The type of the argument (bool, or exp)
+        - warp = "false": (optional) Whether the procedure is a warp procedure or not
+        - definition (bool): (optional) Whether the procedure is being defined or not (allows func to be used before definition)
+        - call_args (dict): (optional) The arguments for the procedure if a promise is required (i.e. procedure has not been defined yet)
+            - call_args["id"] (str): (optional) The id for the procedure call block to update
+            - call_args["arg_vals" (dict): (optional) The arguments for the procedure call block (if needed for a procedure promise)
+
+        ### Returns:
+        - details (dict): The details of the procedure
+            - details["defined"]: Whether the procedure is defined or not
+            - details["proccode"]: The code for the procedure
+            - details["argumentids"]: The ids of the arguments for the procedure
+            - details["argumentnames"]: The names of the arguments for the procedure
+            - details["argumenttypes"]: The types of the arguments for the procedure
+            - details["warp"]: Whether the procedure is a warp procedure or not
+        """
+        
+        if definition:
+            self.context.log(f"🧱🌎 - Procedure '{name}' is being defined")
+        else:
+            if error_handler.is_enabled(error_handler.TRACE):
+                self.context.log(f"🧱🙏 - Procedure '{name}' is being read", error_handler.TRACE)
+
+        if r"%d" in name or r"%s" in name:
+            self.context.add_error(f"⁉️🧩 - Invalid function name '{name}' because of string sequence '{'%d' if '%d' in name else '%s'}'",name,self.line)
+            self.context.throw_errors()
+
+        if not name in self.procedures: # If procedure has not been documented yet:
+            argumentids = [self._generate_id(arg="procArg") for _ in args]
+            argumentnames = [arg["name"] for arg in args]
+
+            proccode = ""
+            argumenttypes = []
+            argumentdefaults = []
+            if definition: # If procedure is being defined, and hasn't been documented yet, set up argument types, proccode, and types
+                argumenttypes = [arg["type"] for arg in args]
+                proccode = name
+                for arg in args:
+                    if arg["type"] == "bool":
+                        proccode += f" %b"
+                        argumentdefaults.append("false")
+                    elif arg["type"] == "exp":
+                        proccode += f" %s"
+                        argumentdefaults.append("")
+                    else:
+                        self.context.add_error(f"⁉️🧩 - Unexpected argument type '{arg['type']}' for procedure '{name}'", name, self.line)
+                        self.context.throw_errors()
+                        
+            else:
+                # If the proc is being read, but has not been documented yet, create a request
+                if name in self.procRequests:
+                    self.procRequests[name].append(call_args)
+                else:
+                    self.procRequests[name] = [call_args]
+            
+            self.procedures[name] = {"defined": definition, 
+                                    "proccode": proccode.strip(),
+                                    "argumentids": argumentids,
+                                    "argumentnames": argumentnames,
+                                    "argumenttypes": argumenttypes,
+                                    "argumentdefaults": argumentdefaults,
+                                    "warp": warp}
+            
+        elif definition: # If the proc is being defined, but has been used before, correct: proccode, argumenttypes, warp
+            argumenttypes = [arg["type"] for arg in args]
+            proccode = name
+            argumentdefaults = []
+            for arg in args:
+                if arg["type"] == "bool":
+                    proccode += f" %b"
+                    argumentdefaults.append("false")
+                elif arg["type"] == "exp":
+                    proccode += f" %s"
+                    argumentdefaults.append("")
+                else:
+                    self.context.add_error(f"⁉️🧩 - Unexpected argument type '{arg['type']}' for procedure '{name}", name, self.line)
+                    self.context.throw_errors()
+
+            # Correct values
+            self.procedures[name]["defined"] = True
+            self.procedures[name]["proccode"] = proccode
+            self.procedures[name]["argumenttypes"] = argumenttypes
+            self.procedures[name]["argumentdefaults"] = argumentdefaults
+            self.procedures[name]["warp"] = warp
+            
+            # Correct any orders for this procedure
+            if name in self.procRequests:
+                self._fix_proc_requests(name, proccode, argumentdefaults, warp)
+
+        return self.procedures[name]
+
+    def _fix_proc_requests(self, name: str, proccode: str, argumentdefaults: list, warp: str):
+        """
+        Fills in the procedure calls made before the procedure was defined (procedure promises)
+
+        ### Parameters:
+        - name (str): The procedure name
+        - proccode (str): The procedure's proccode
+        - argumentdefaults (list): The procedure's argument defaults
+        - warp (str): Whether the procedure is a warp procedure or not
+        """
+
+        for data in self.procRequests[name]:
+            # Get data about procedure promise
+            id = data["id"]
+            arg_vals = data["arg_vals"]
+            
+            # Log promise information
+            self.context.log(f"🧩🛠️ - Fixing proccall '{id}' for proc '{name}'")
+            
+            # Execute promise for information about procedure
+            self.target["blocks"][id]["mutation"]["proccode"] = proccode
+            self.target["blocks"][id]["mutation"]["argumentdefaults"] = argumentdefaults
+            self.target["blocks"][id]["mutation"]["warp"] = warp
+            self.target["blocks"][id]["mutation"]["argumentids"] = str(self.procedures[name]["argumentids"]).replace("'", '"')
+            
+            proc = self.procedures[name]                    
+            self.target["blocks"][id]["inputs"] = {arg_block: self.format_args(self._simplify_args([arg_vals[arg_name]])[0], type) for arg_block, arg_name, type in zip(proc["argumentids"], proc["argumentnames"], proc["argumenttypes"])}
+    
+    # Func for formatting arguments
+    def format_args(self, arg, type):
+        boolean = type == "bool"
+        match arg[0]:
+            case "str":
+                return [1, [10, arg[1]]]
+            case "num":
+                return [1, [4, arg[1]]]
+            case "variable":
+                return [3, [12, arg[1][0], arg[1][1]], [10, "❤️"]]
+            case "list":
+                return [3, [13, arg[1][0], arg[1][1]], [10, "❤️"]]
+            case "reporter":
+                return [3, arg[1][0], [10, "❤️"]] if not boolean else [2, arg[1][0]]
+    
+    def _process_procDef(self, name, args, comment):
+        """
+        Process a procedure definition
+
+        ### Parameters:
+        - name (str): The name of the procedure to be defined
+        - args (list): The arguments for the procedure
+        - comment (str): The comment for the procedure
+        """
+        
+        # Log procDef call
+        self.context.log(f"🧱🫸 - Procedure definition of '{name}' with arguments '{args}' is being defined ...")
+
+        # Set up current procedure for argument handling
+        self.curProc = name
+
+        # Set up position
+        x = self.stacks * self.stack_spacing
+
+        processed_args = [] # For storing processed arguments
+        
+        # Validify warp argument
+        if not args[0][5:] in ["false", "true"]:
+            self.context.add_error(f"⁉️🧩 - Invalid warp argument '{args[0]}' for procedure definition of '{name}'", name, self.line)
+            self.context.throw_errors()
+          
+        # Process arguments  
+        for arg in args[1:]: # First argument for determining warp or not for proc
+            # Validify type of argument
+            if not "[" in arg:
+                self.context.add_error(f"⁉️🧩 - '[' not found for argument '{arg}' for procedure definition of '{name}'", name, self.line)
+                self.context.throw_errors()
+            if not "]" in arg:
+                self.context.add_error(f"⁉️🧩 - ']' not found for argument '{arg}' for procedure definition of '{name}'", name, self.line)
+                self.context.throw_errors()
+            
+            argType = arg[arg.rfind("[")+1:arg.rfind("]")]
+            argName = arg[:arg.rfind("[")]
+            processed_args.append({"name": argName, "type": argType})
+
+        # Create/correct procedure
+        proc = self._read_procedure(name, processed_args, args[0][5:], definition=True)
+
+        # Create definition block
+        block_id = self._generate_id() # Create id
+        block = {
+            "opcode": "procedures_definition",
+            "next": None,
+            "parent": None,
+            "inputs": {"custom_block": [1, None]},
+            "fields": {},
+            "shadow": False,
+            "topLevel": True,
+            "x": x,
+            "y": 0
+        }
+
+        # Create proc prototype block
+        proto_id = self._generate_id() # Create id for proc prototype
+        block["inputs"] = {"custom_block": [1, proto_id]} # Update input
+
+        # Create proc argument blocks
+        arg_blocks = {self._generate_id(): {"opcode": "argument_reporter_" + "string_number" if type == "exp" else "boolean",
+                                            "next": None,
+                                            "parent": proto_id,
+                                            "inputs": {},
+                                            "fields": {"VALUE": [name, None]},
+                                            "shadow": True,
+                                            "topLevel": False}
+                                                for type, name in zip(proc["argumenttypes"], proc["argumentnames"])}
+        
+        # Create proto block
+        proto_block = {
+            "opcode": "procedures_prototype",
+            "next": None,
+            "parent": block_id,
+            "inputs": {id: [1, arg_block] for arg_block, id in zip(arg_blocks, proc["argumentids"])},
+            "fields": {},
+            "shadow": True,
+            "topLevel": False,
+            "mutation": {
+                "tagName": "mutation",
+                "children": [],
+                "proccode": proc["proccode"],
+                "argumentids": str(proc["argumentids"]).replace("'", '"'),
+                "argumentnames": str(proc["argumentnames"]).replace("'", '"'),
+                "argumentdefaults": str(proc["argumentdefaults"]).replace("'", '"'),
+                "warp": proc["warp"]
+            }
+        }
+
+        # Save all blocks into target["blocks"]
+        self.target["blocks"][block_id] = block
+        for arg_block in arg_blocks:
+            self.target["blocks"][arg_block] = arg_blocks[arg_block]
+        self.target["blocks"][proto_id] = proto_block
+
+        # Return [hat id, json_data] for defining hat block
+        return [block_id, block]
+
+    def _process_procCall(self, name, args, comment, prev_block_id):
+        """
+        Process a procedure call
+
+        ### Parameters:
+        - name (str): The name of the procedure to be called
+        - args (tuple[tuple[str, ast_parser.Expr], ...]): The (argument name, value) pairs for the procedure
+        - comment (str): The comment for the procedure
+        - prev_block_id (str): The previous block's id
+        """
+
+        processed_args = [{"name": arg_name} for arg_name, _ in args] # Processed arguments
+        arg_vals = dict(args) # Dictionary for storing arguments' values (the expression of each value)
+
+        # Create call block id
+        call_id = self._generate_id() # Create id
+        
+        # Create/read procedure
+        proc = self._read_procedure(name, processed_args, definition=False, call_args={"id": call_id, "arg_vals": arg_vals})
+
+        # Create proc argument blocks
+        arg_blocks = {self._generate_id(): {"opcode": "argument_reporter_" + "string_number" if type == "exp" else "boolean",
+                                            "next": None,
+                                            "parent": call_id,
+                                            "inputs": {},
+                                            "fields": {"VALUE": [name, None]},
+                                            "shadow": True,
+                                            "topLevel": False}
+                                                for type, name in zip(proc["argumenttypes"], proc["argumentnames"])}
+
+        self.argument_limit = 0 # Argument limit for resizing
+
+        # Create call block
+        call_block = {
+            "opcode": "procedures_call",
+            "next": None,
+            "parent": prev_block_id,
+            "inputs": {arg_block: self.format_args(self._simplify_args([arg_vals[arg_name]])[0], type) for arg_block, arg_name, type in zip(proc["argumentids"], proc["argumentnames"], proc["argumenttypes"])},
+            "fields": {},
+            "shadow": False,
+            "topLevel": False,
+            "mutation": {
+                "tagName": "mutation",
+                "children": [],
+                "proccode": proc["proccode"],
+                "argumentids": str(proc["argumentids"]).replace("'", '"'),
+                "warp": proc["warp"]
+            }
+        }
+
+        # Save blocks
+        for arg_block in arg_blocks:
+            self.target["blocks"][arg_block] = arg_blocks[arg_block]
+        self.target["blocks"][call_id] = call_block
+
+        # Return [hat id, json_data] for next block to reference
+        return [call_id, call_block]
+    
+    def _create_comment(self, comment: str, block_id: str, height=None):
+        """
+        Returns the id of a comment. Creates the comment if it does not exist
+
+        ### Parameters:
+        - comment (str): The comment to add
+        - block_id (str): The id of the block that the comment is attached to
+        - height (int | None): The y-position of the comment, defaults to self.stack_height
+
+        ### Returns:
+        - str: The id of the comment
+        """
+
+        offset = 15 # There is an offset between the middle of the block, and where the comment connects to the block
+        comment_id = self._generate_id(arg="comment")
+        self.target["comments"][comment_id] = {
+            "blockId": block_id,
+            "x": self.stacks * self.stack_spacing + self.stack_width + self.comment_offset,
+            "y": height-offset if height else self.stack_height-offset,
+            "width": 200,
+            "height": 200,
+            "minimized": True,
+            "text": comment
+        }
+        return comment_id
+    
+    def _generate(self, statements: tuple):
+        """
+        Generates the blocks of the given statements (one stack) and adds them to self.target (current target)
+
+        ### Parameters:
+        - statements (tuple): The statements (ast_parser nodes) of the stack
+        """
+
+        _run_frames(self._generate_stack(statements))
+
+    def _generate_stack(self, statements: tuple, substack=False, depth=0):
+        """
+        Generator frame generating one stack (see _generate). Substacks of c-blocks are yielded as new frames instead of recursing,
+        and _run_frames sends their top block IDs back, so deeply nested c-blocks can't hit the recursion limit.
+
+        ### Parameters:
+        - statements (tuple): The statements (ast_parser nodes) of the stack
+        - substack (bool): Whether this is a substack (used for generating nested c blocks)
+        - depth (int): The current depth of the stack (used for indented c blocks)
+
+        ### Returns:
+        - top_id (str | None): The ID of the topmost block [IF] it is a substack for processing substacks
+        """
+
+        heights = {
+            "hat": 48,
+            "reporter": 0, # Look in "_simplify_args" to see/edit this value. It is applied there bc there reporters in reporters are processed
+            "stack": 48,
+            "extension_stack": 56,
+            "c": 48,
+            "c_end": 32,
+            "cap": 48
+        }
+
+        prev_block = []
+        top_id = ""
+        for statement in statements:
+            self.line = statement.line
+            comment = statement.comment
+
+            # Log line
+            if error_handler.is_enabled(error_handler.TRACE):
+                self.context.log(f"〰️ - [{self.line}] On line: {statement.name}", error_handler.TRACE)
+
+            # Process function calls
+            if isinstance(statement, ast_parser.ProcCall):
+                if prev_block:
+                    block = self._process_procCall(statement.name, statement.args, comment, prev_block[0]) # Process block
+                    prev_block[1]["next"] = block[0]
+                else:
+                    block = self._process_procCall(statement.name, statement.args, comment, None) # Process block
+                    self.target["blocks"][block[0]]["toplevel"] = True
+
+                # Embed into the rest of the blocks
+                prev_block = block
+                if not top_id and substack:
+                    top_id = block[0]
+                continue
+
+            if isinstance(statement, ast_parser.ProcDef):
+                prev_block = self._process_procDef(statement.name, list(statement.params), comment) # Process block
+                continue
+
+            # Define type of block being processed
+            name = statement.name
+            command = command_manager.read_by_name(name) # Shared registry entry, so it is never modified here
+
+            if command: # Check if it found command for the name
+                token_type = command["type"]
+
+                # Pseudo implementation for width of blocks. Can't do much better without spending 100s of hours documenting the widths based on comment positions auto-generated by scratch
+                self.stack_width = 300 + depth * 20
+
+                # Set self.argument_limit to the maximum depth of arguments it can take before expanding vertically
+                self.argument_limit = 0 # Will start increasing when argument depth is great than the argument limit (0 --> skip 1st, 1 --> skip 2nd, etc.)
+
+                # Check for pen extension stacks
+                if "pen" in command["opcode"] and token_type == "stack": # For some odd reason, extension stack blocks are longer than regular stack blocks 😖
+                    self.argument_limit =  1 # Will start increasing when argument depth is great than the argument limit (0 --> skip 1st, 1 --> skip 2nd, etc.)
+                    token_type = "extension_stack"
+
+                self.stack_height += heights[token_type] / 2 # Add first half of the block (midway down the block for comment)
+            else:
+                self.context.add_error(f"Invalid command '{name}'", name, self.line)
+                self.context.throw_errors()
+
+            # Get current stack height before adding inside tokens (to help c-blocks find where their comments should go)
+            current_stack_height = self.stack_height # Get height BEFORE parsing arguments, so we can later add half of the height
+
+            if len(statement.args) > 0: # Might have no arguments
+                # Parse the arguments
+                func_args = self._simplify_args(statement.args)
+
+                if token_type == "extension_stack":
+                    arg_height = self.itr - 1 # Extension stacks can handle 2 layers of arguments before expanding
+                    arg_height = arg_height if arg_height >= 0 else 0 # Make sure no negitive heights. If self.itr is 0, we don't want -1
+                else:
+                    arg_height = self.itr
+
+                # Add half the arguments height to the current stack height
+                current_stack_height += (arg_height * 8) / 2
+            else:
+                # Make empty argument list
+                func_args = []
+
+            # Get current stack width after parsing the arguments, to now allow any other parsing to proceed
+            current_stack_width = self.stack_width
+
+            # Add second half of the block
+            self.stack_height += heights[token_type] / 2
+            # Create the block
+            if token_type == "c": # C-blocks need to generate their substack blocks
+                substacks = statement.substacks or ((),)
+
+                # Generate the substacks into blocks
+                substack_top_block = yield self._generate_stack(substacks[0], substack=True, depth=depth+1)  # Top block of the substack1
+                substack2_top_block = ""
+                if len(substacks) > 1:
+                    self.stack_height += heights["c_end"] # Increment stack height for middle block of "if-else" block
+                    substack2_top_block = yield self._generate_stack(substacks[1], substack=True, depth=depth+1)  # Top block of the substack2
+
+                # Add the substack block as an argument to the func_args
+                func_args.append(["substack", substack_top_block])
+                if substack2_top_block:
+                    name = "ifelse"
+                    func_args.append(["substack", substack2_top_block])
+
+                # Set the width to the previously stored width
+                self.stack_width = current_stack_width
+
+                # Create the c-block
+                new_block = self._create_block(name, func_args, prev_block, [comment, current_stack_height - 5]) # Reduce by a little bit to account for a weird offset
+
+                # Update the substack_top_block to have the parent be the c-block
+                if substack_top_block: # Empty substacks have no top block
+                    self.target["blocks"][substack_top_block]["parent"] = new_block[0]
+
+                # Increase height by end of c-block
+                self.stack_height += heights["c_end"]
+
+            else: # Normal parse. Any block that isnt a c-block will be processed this way
+                new_block = self._create_block(name, func_args, prev_block, [comment, current_stack_height])
+            
+            if prev_block:
+                prev_block[1]["next"] = new_block[0] # Update the previous block's "next" attribute
+            elif not substack:
+                new_block[1]["topLevel"] = True # Update the current block's "topLevel" attribute to be top-level if it has no parents
+
+            # Save the block, and update the previous block
+            self.target["blocks"][new_block[0]] = new_block[1]
+            if not top_id and substack: # Log if it is the top of the stack and is part of a substack
+                top_id = new_block[0]
+            prev_block = new_block
+
+        if substack:
+            if error_handler.is_enabled(error_handler.TRACE):
+                self.context.log("⏬ - I is a Substack: " + top_id, error_handler.TRACE)
+            return top_id # Return the top block of the substack
+
+    def _simplify_args(self, args: tuple, itr = 0):
+        """
+        Simplifies the arguments, creating the blocks of reporters (and the reporters inside them).
+        The argument lists of reporters in reporters are stacked up in a list (innermost last) rather than simplified by nested calls.
+
+        ### Parameters:
+        - args (tuple[ast_parser.Expr, ...]): The argument expressions to simplify
+        - itr (int): Reporter depth of the arguments (0 for the arguments of a stack block)
+
+        ### Returns:
+        - return_args (list): The simplified list of arguments (2D array)
+            List of [type, relavent_data] for each argument
+        """
+
+        if itr == 0: # Arguments of a stack block
+            self.itr = 0 if self.argument_limit == 0 else 1 # Make sure that extension_stack blocks start with 1 iteration forwards, because they can handle 1 extra depth without changing height
+
+        def _check_width(arg_width, extra=0):
+            """
+            Checks if the width of the argument is greater than a threshold.
+            If it is, then adds some width to the stack width.
+            """
+            arg_width += extra
+            if arg_width > 14:
+                self.stack_width += arg_width * 1.4 - 14
+
+        # Argument lists being simplified, innermost last: [arguments, index of the next argument, simplified arguments (2d list of [type, relavent_data]), depth]
+        levels = [[args, 0, [], itr]]
+        while True:
+            level = levels[-1]
+            args, idx, return_args, itr = level
+
+            if idx == len(args): # All arguments of the list are simplified
+                self.context.throw_errors() # Will automatically check for any errors, and will raise all found errors
+                levels.pop()
+                if not levels:
+                    return return_args
+
+                # Create the reporter block the arguments belong to
+                parent = levels[-1]
+                func = self._create_block(parent[0][parent[1]].name, return_args)
+
+                self.target["blocks"][func[0]] = func[1] # Add the block to target
+                parent[2].append(["reporter", func]) # Return the block
+                parent[1] += 1
+                continue
+
+            node = args[idx]
+            if isinstance(node, ast_parser.Call):
+                arg = node.name
+            else:
+                arg = node.text
+
+                # Find width of argument using helvitica neue font. If it exceeds a threshold, then add some width
+                width = font_width.get_width(arg if not "a." in arg else arg[2:])
+
+            # Parse argument
+            if isinstance(node, ast_parser.Variable):
+                _check_width(width, 10)
+                var_name = node.name
+                return_args.append(["variable", [var_name, self._read_variable(var_name)]])
+                if itr > self.itr: # Depth has not been reached before
+                    if error_handler.is_enabled(error_handler.TRACE):
+                        self.context.log("🏢⬆️ - Increasing stack height: " + arg + " at depth: " + str(itr) + " with limit: " + str(self.itr), error_handler.TRACE)
+                    self.itr += 1
+                    self.stack_height += 8 # Increase the stack height
+            elif isinstance(node, ast_parser.ListRef):
+                _check_width(width, 10)
+                list_name = node.name
+                return_args.append(["list", [list_name, self._read_list(list_name)]])
+            elif isinstance(node, ast_parser.ProcArg):
+                _check_width(width, 10)
+                reporter_name = node.name
+                info = self._read_procedure(self.curProc) # Get procedure info
+                
+                # Figure out if argument actually exists
+                if not reporter_name in info["argumentnames"]:
+                    self.context.log(info["argumentnames"], error_handler.ERROR)
+                    self.context.add_error(f"Argument '{reporter_name}' does not exist in procedure '{self.curProc}'", arg, self.line)
+                    self.context.throw_errors()
+                
+                idx = info["argumentnames"].index(reporter_name) # Get index of argument
+                type = info["argumenttypes"][idx] # Get type
+                proc_arg = self._create_block(f"funcarg{type}", [["str", reporter_name]]) # Create the argument block
+                
+                self.target["blocks"][proc_arg[0]] = proc_arg[1] # Add the block to target
+                return_args.append(["reporter", proc_arg]) # Return the block
+            elif isinstance(node, ast_parser.Literal):
+                _check_width(width)
+                return_args.append([node.kind, node.value])
+            elif isinstance(node, ast_parser.Call):
+                self.stack_width += 100 # Increase width of stack
+                if itr > self.itr: # Depth has not been reached before
+                    if error_handler.is_enabled(error_handler.TRACE):
+                        self.context.log("🏢⬆️ - Increasing stack height: " + arg + " at depth: " + str(itr), error_handler.TRACE)
+                    self.itr += 1
+                    self.stack_height += 8 # Increase the stack height
+                # Simplify the reporter's arguments first, its block is created once they are done
+                levels.append([node.args, 0, [], itr + 1])
+                continue
+            else:
+                self.context.add_error("Invalid argument type",arg,self.line)
+
+            level[1] += 1
+
+    def _create_block(self, name, args, prev=None, comment=None):
+        """
+        Creates a new block given its name and arguments
+
+        ### Parameters:
+        - name (str): The name of the block
+        - args (list): The arguments for the block
+        - prev (list): The previous block (if any)
+            - [0]: The previous block's id
+            - [1]: The previous block's data
+        - comment (list | None): The comment for the block
+            - [0]: The comment for the block
+            - [1]: The height at which to place the block
+        
+        ### Returns:
+        - block_id (str): The ID of the block
+        - block (dict): The created block
+            - ["opcode"]: The opcode of the block
+            - ["parent"]: The ID of the parent block
+            - ["next"]: The ID of the next block
+            - ["inputs"]: The inputs for the block
+            - ["fields"]: The fields for the block
+            - ["shadow"]: A boolean indicating if the block is a shadow block
+            - ["topLevel"]: A boolean indicating if the block is top-level
+            - ["x"]: The x-coordinate of the block
+            - ["y"]: The y-coordinate of the block
+        """
+        # Create a new ID for the block
+        block_id = self._generate_id()
+
+        # Get data about block (input parameters)
+        data = command_manager.read_by_name(name)
+        if error_handler.is_enabled(error_handler.TRACE):
+            self.context.log("👀 - Getting block: " + name, error_handler.TRACE)
+        if not data:
+            self.context.add_error(f"Invalid command '{name}'", name, self.line)
+            self.context.throw_errors()
+
+        # Create block template
+        block = {
+            "opcode": data["opcode"],
+            "parent": None,
+            "next": None,
+            "inputs": {},
+            "fields": {},
+            "shadow": data["shadow"], # If its a menu block, it needs a shadow flag
+            "topLevel": False
+        }
+
+        # Check if a comment exists, if it does, add it
+        if comment:
+            if comment[0]:
+                block["comment"] = self._create_comment(comment[0], block_id, comment[1])
+
+        # If block is not a reporter, create x and y coordinates for it
+        if data["type"] == "hat":
+            block["x"] = self.stacks * self.stack_spacing
+            block["y"] = 0
+
+        # Set parent block
+        if prev:
+            block["parent"] = prev[0]
+
+        specs = data["specs"]
+
+        # Check for correct number of arguments
+        if len(specs) != len(args):
+            self.context.add_error(f"🔢❌ - Invalid number of arguments. '{name}' expects [{len(specs)}] arguments, but got [{len(args)}]", args, self.line)
+            self.context.throw_errors()
+
+        # Input args
+        for spec, arg in zip(specs, args):
+            if spec.boolean and not arg[0] == "reporter":
+                self.context.add_error(f"⁉️🧩Invalid input argument type. Expected 'boolean', got '{arg[0]}'", spec.key, self.line)
+                self.context.throw_errors()
+
+            # Handle menu items. These are not written directly, but instead are generated based on the arguments from their parents
+            if spec.menu and arg[0] == "str": # parse menu items
+                arg[0] = "menu" # set the type to menu
+                menu = self._create_block(spec.menu, [["str", str(arg[1])]], [block_id, block])
+                arg[1] = menu[0] # provide the menu's opcode to the parent block
+                self.target["blocks"][menu[0]] = menu[1] # add the block to the block list
+
+            # Preprocess the argument, checking if it is a broadcast argument. If it is, change the arg[0] type to broadcast
+            if spec.broadcast and (arg[0] == "str" or arg[0] == "num"):
+                arg[0] = "broadcast"
+
+            fill_arg = spec.key
+
+            # Handle input arguments, correctly adding them to the block json data
+            if spec.kind == "input": # i. --> argument goes into inputs
+                match arg[0]:
+                    case "str":
+                        block["inputs"][fill_arg] = [1, [10, arg[1]]]
+                    case "num":
+                        block["inputs"][fill_arg] = [1, [4, arg[1]]]
+                    case "variable":
+                        block["inputs"][fill_arg] = [3, [12, arg[1][0], arg[1][1]], [10, "❤️"]]
+                    case "list":
+                        block["inputs"][fill_arg] = [3, [13, arg[1][0], arg[1][1]], [10, "❤️"]]
+                    case "reporter":
+                        self.target["blocks"][arg[1][0]]["parent"] = block_id
+                        block["inputs"][fill_arg] = [3, arg[1][0], [10, "❤️"]] if not spec.boolean else [2, arg[1][0]]
+                    case "substack":
+                        if arg[1]: # Empty substacks have no input, like in Scratch
+                            block["inputs"][fill_arg] = [2, arg[1]]
+                    case "menu":
+                        block["inputs"][fill_arg] = [1, arg[1]]
+                    case "broadcast":
+                        block["inputs"][fill_arg] = [1, [11, arg[1], self._read_broadcast(arg[1])]]
+            else: # f. --> argument goes into fields
+                match arg[0]:
+                    case "str":
+                        block["fields"][fill_arg] = [arg[1], None]
+                    case "num":
+                        block["fields"][fill_arg] = [arg[1], None]
+                    case "variable":
+                        block["fields"][fill_arg] = arg[1]
+                    case "list":
+                        block["fields"][fill_arg] = arg[1]
+                    case "broadcast":
+                        block["fields"][fill_arg] = [arg[1], self._read_broadcast(arg[1])]
+
+        return block_id, block
+
+
+def _renumber_value(value, ids: dict):
+    """
+    Renumbers an input or field value ([shadow, block id | [type, ...], ...] or [value, id | None])
+    """
+
+    renumbered = []
+    for item in value:
+        if isinstance(item, str):
+            renumbered.append(ids.get(item, item))
+        elif isinstance(item, list) and item and item[0] in (11, 12, 13): # [type, name, broadcast/variable/list id]
+            renumbered.append([item[0], item[1], ids.get(item[2], item[2])])
+        else:
+            renumbered.append(item)
+    return renumbered
+
+def _renumber_block(block: dict, ids: dict):
+    """
+    Returns a copy of a block with its ids renumbered. Keys keep their order, so the json is the same as the block generated in place
+    """
+
+    renumbered = {}
+    for key, value in block.items():
+        match key:
+            case "parent" | "next" | "comment":
+                renumbered[key] = ids.get(value, value) if value else value
+            case "inputs":
+                renumbered[key] = {ids.get(name, name): _renumber_value(input, ids) for name, input in value.items()}
+            case "fields":
+                renumbered[key] = {name: [field[0], ids.get(field[1], field[1])] if isinstance(field[1], str) else field for name, field in value.items()}
+            case "mutation" if "argumentids" in value:
+                mutation = dict(value)
+                mutation["argumentids"] = str([ids.get(id, id) for id in json.loads(value["argumentids"])]).replace("'", '"')
+                renumbered[key] = mutation
+            case _:
+                renumbered[key] = value
+    return renumbered
+
+def procedure_names(tree: ast_parser.Program) -> set:
+    """
+    Returns the names of all procedures defined or called in a program
+
+    ### Parameters:
+    - tree (ast_parser.Program): The parsed program
+
+    ### Returns:
+    - names (set[str]): The procedure names
+    """
+
+    names = set()
+    pending = [script.statements for script in tree.scripts]
+    while pending:
+        for statement in pending.pop():
+            if isinstance(statement, (ast_parser.ProcCall, ast_parser.ProcDef)):
+                names.add(statement.name)
+            elif statement.substacks:
+                pending.extend(statement.substacks)
+    return names
+
+def compile_target(tree: ast_parser.Program, stacks: int) -> dict:
+    """
+    Generates the blocks of one target on its own, for merging into a project with generator.merge() (runs in worker processes)
+
+    ### Parameters:
+    - tree (ast_parser.Program): The parsed program of the target
+    - stacks (int): Number of stacks before this target (stacks are tiled across the whole project)
+
+    ### Returns:
+    - compiled (dict): The generated blocks, comments, symbol tables and id counters, the compile log and the stage timer (see stage_timer.add())
+        - ["error"] (str | None): The error message if the program has errors (the log then ends with them)
+    """
+
+    context = error_handler.CompileContext(None) # Keeps the log in memory, the project writes it in order
+    code_generator = generator(context)
+    code_generator.stacks = stacks
+    timer = timings.stage_timer()
+    code_generator.time_stages(timer)
+    target = {"blocks": {}, "comments": {}}
+    error = None
+    try:
+        with timer.span("generate"):
+            code_generator.generate(target, tree)
+            code_generator.check_procedures()
+    except error_handler.CmdError as e:
+        error = e.message
+
+    return {"blocks": target["blocks"],
+            "comments": target["comments"],
+            "variables": code_generator.variables,
+            "lists": code_generator.lists,
+            "broadcasts": code_generator.broadcasts,
+            "id_list": code_generator.id_list,
+            "stacks": code_generator.stacks,
+            "log": context.buffer,
+            "timer": timer,
+            "error": error}
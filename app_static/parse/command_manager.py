@@ -3,7 +3,80 @@ Manages commands file
 """
 
 import error_handler
+import hashlib
 import os
+import threading
+import time
+from typing import NamedTuple
+
+COMMANDS_PATH = os.path.join('app_static', 'references', 'commands.txt')
+CHECK_INTERVAL = 1.0 # Minimum number of seconds between checks of the commands file's mtime
+
+# Process-wide command registry. Loaded once, and only reloaded when commands.txt changes on disk
+_registry = {
+    "mtime": None,     # mtime (ns) of commands.txt when the registry was loaded
+    "digest": None,    # Hash of the contents of commands.txt (the version of the command set)
+    "checked": 0.0,    # time.monotonic() of the last mtime check
+    "by_name": {},     # Lower-cased command name --> command attributes
+    "by_opcode": {}    # OpCode --> command attributes
+}
+_registry_lock = threading.Lock()
+
+class InputSpec(NamedTuple):
+    """
+    Precompiled description of one input of a command (one entry of the inputs column in commands.txt)
+    """
+
+    kind: str         # "input" (i.) or "field" (f.)
+    key: str          # Key used in the block's inputs/fields (upper-cased unless keep_case)
+    boolean: bool     # Whether the input only accepts boolean reporters ([bool] hint)
+    menu: str | None  # Name of the menu command generating this input's shadow block ((menu) hint), if any
+    broadcast: bool   # Whether string/number values are broadcast names
+    keep_case: bool   # Pen extension menus do not use all caps keys
+
+def _compile_inputs(name: str, opcode: str, inputs: str) -> tuple[InputSpec, ...]:
+    """
+    Compiles the inputs column of a command into immutable input specs
+
+    ### Parameters:
+    - name (str): Name of the command
+    - opcode (str): OpCode of the command
+    - inputs (str): Input names of the command (separated by commas), e.g. "i.condition[bool],i.substack"
+
+    ### Returns:
+    - specs (tuple[InputSpec, ...]): One spec per input, in order
+    """
+
+    specs = []
+    keep_case = "menu" in name and "pen_" in opcode # Pen extention blocks do not use all caps arguments for some reason 😖
+    for fill_arg in (inputs.split(",") if inputs else []):
+        # Figure out if arguments are for inputs or fields, and remove the leading type (e.g. i.arg --> arg, or f.arg --> arg)
+        kind = "input"
+        if fill_arg.startswith("i."):
+            fill_arg = fill_arg[2:]
+        elif fill_arg.startswith("f."):
+            kind = "field"
+            fill_arg = fill_arg[2:]
+
+        # Remove hints. These will hopefully be used when we get a gui for autocompletion
+        boolean = "[bool]" in fill_arg
+        if boolean:
+            fill_arg = fill_arg[:fill_arg.find("[")] + fill_arg[fill_arg.find("]")+1:]
+
+        # Menu items are not written directly, but instead are generated based on the arguments from their parents
+        menu = None
+        if "(" in fill_arg:
+            menu = fill_arg[fill_arg.find("(")+1:fill_arg.find(")")]
+            fill_arg = fill_arg[:fill_arg.find("(")] + fill_arg[fill_arg.find(")")+1:]
+
+        specs.append(InputSpec(kind=kind,
+                               key=fill_arg if keep_case else fill_arg.upper(),
+                               boolean=boolean,
+                               menu=menu,
+                               broadcast="broadcast" in fill_arg,
+                               keep_case=keep_case))
+
+    return tuple(specs)
 
 def read_commands() -> list[str]:
     """
@@ -13,14 +86,14 @@ def read_commands() -> list[str]:
     - found_commands (list[str]): Cleaned list of commands
     """
 
-    with open(os.path.join('app_static', 'references', 'commands.txt'), "r") as f:
+    with open(COMMANDS_PATH, "r") as f:
         commands = f.readlines()
         found_commands = []
 
         for command in commands:
             if command.startswith("#") or command == "\n": # Ignore commented lines
                 continue
-            
+
             command = command.strip() # Remove leading and trailing whitespaces
             if "{" in command: # Ignore the metadata for the command. This is primarily for future hinting when writing code
                 command = command.split("{")[0] + command.split("}")[1]
@@ -30,10 +103,73 @@ def read_commands() -> list[str]:
 
     return found_commands
 
+def _load_registry(force: bool = False) -> dict:
+    """
+    Returns the command registry, (re)loading it from the commands file if it has not been loaded yet or if the file's mtime changed.
+    The mtime is checked at most once every CHECK_INTERVAL seconds.
+
+    ### Parameters:
+    - force (bool): (optional) Check the file's mtime regardless of CHECK_INTERVAL
+
+    ### Returns:
+    - registry (dict): The process-wide command registry
+    """
+
+    now = time.monotonic()
+    if not force and _registry["mtime"] is not None and now - _registry["checked"] < CHECK_INTERVAL:
+        return _registry
+
+    with _registry_lock:
+        mtime = os.stat(COMMANDS_PATH).st_mtime_ns
+        _registry["checked"] = now
+        if mtime == _registry["mtime"]:
+            return _registry
+
+        with open(COMMANDS_PATH, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        attributes = ["name","opcode","type","inputs"]
+        by_name = {}
+        by_opcode = {}
+        for command in read_commands():
+            command_dict = dict(zip(attributes, command.split(":")))
+            command_dict["specs"] = _compile_inputs(command_dict["name"], command_dict["opcode"], command_dict.get("inputs", ""))
+            command_dict["shadow"] = "menu" in command_dict["name"] # Menu blocks are shadow blocks
+            by_name.setdefault(command_dict["name"].lower(), command_dict) # First definition wins, like the old linear search
+            by_opcode.setdefault(command_dict["opcode"], command_dict)
+
+        # Swap in the new tables all at once so concurrent readers never see a half-built registry
+        _registry["by_name"] = by_name
+        _registry["by_opcode"] = by_opcode
+        _registry["digest"] = digest
+        _registry["mtime"] = mtime
+
+    return _registry
+
+def reload():
+    """
+    Forces a check of the commands file, reloading the registry if it changed on disk.
+    """
+
+    _load_registry(force=True)
+
+def version() -> str:
+    """
+    Returns the version of the loaded command set (a hash of the contents of commands.txt).
+    Anything derived from the commands (e.g. cached parse trees) should be keyed by it.
+
+    ### Returns:
+    - digest (str): Hex digest of commands.txt
+    """
+
+    return _load_registry()["digest"]
+
 def read_by_opcode(opcode: str) -> dict:
     """
     Returns a dictionary of attributes about a command given its opcode
 
+    NOTE: The returned dictionary is shared by the whole process and must not be modified
+
     ### Parameters:
     - opcode (str): OpCode of the command
 
@@ -43,19 +179,14 @@ def read_by_opcode(opcode: str) -> dict:
         - ["opcode"] (str): OpCode of the command
         - ["type"] (str): Type of the command
         - ["inputs"] (str): Input names of the command (separated by commas)
+        - ["specs"] (tuple[InputSpec, ...]): Precompiled inputs of the command
+        - ["shadow"] (bool): Whether the command is a (shadow) menu block
     """
 
-    found_commands = read_commands()
-    attributes = ["name","opcode","type","inputs"]
-    command_found = [cmd.split(":") for cmd in found_commands if cmd.split(":")[1] == opcode]
-
-    return_dict = {}
-    for attribute, value in zip(attributes, command_found[0]):
-          return_dict[attribute] = value
+    return_dict = _load_registry()["by_opcode"].get(opcode)
 
     if not return_dict:
-        error_handler.add_error(f"Cmd with opcode: '{opcode}' not found", opcode, -1)
-        error_handler.throw_errors()
+        raise error_handler.CmdError(f"Cmd with opcode: '{opcode}' not found")
 
     return return_dict
 
@@ -66,30 +197,18 @@ def read_by_name(name: str):
     - opcode (str): OpCode of the command
     - type (str): Type of the command
     - inputs (str): Input names of the command (separated by commas)
+    - specs (tuple[InputSpec, ...]): Precompiled inputs of the command
+    - shadow (bool): Whether the command is a (shadow) menu block
+
+    NOTE: The returned dictionary is shared by the whole process and must not be modified
 
     ### Parameters:
     - name (str): Name of the command (different than opCode)
 
     ### Returns:
-    - return_dict (dict): Dictionary with command attributes [name,opcode,type,inputs]
+    - return_dict (dict | None): Dictionary with command attributes [name,opcode,type,inputs], None if the command does not exist
     """
-    
-    name = name.lower()
-    found_commands = read_commands()
-    attributes = ["name","opcode","type","inputs"]
-    command_found = [cmd.split(":") for cmd in found_commands if cmd.split(":")[0].lower() == name]
 
-    if not command_found:
-         return None
-
-    return_dict = {}
-    for attribute, value in zip(attributes, command_found[0]):
-          return_dict[attribute] = value
-
-    if not name:
-        error_handler.add_error(f"Cmd with opcode: '{name}' not found", name, -1)
-        error_handler.throw_errors()
-
-    return return_dict
+    return _load_registry()["by_name"].get(name.lower())
 
 # print(read_by_opcode("motion_glidesecstoxy"))
\ No newline at end of file
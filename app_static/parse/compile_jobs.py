@@ -0,0 +1,275 @@
+"""
+Asynchronous compile jobs, run in a bounded pool of worker processes.
+The status of each job is kept in a file in the project's directory, so any web worker can report it.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+import error_handler
+import main_parser
+import metrics
+
+# Number of processes compiling jobs (per web worker)
+PROCESSES = int(os.environ.get("KATNIP_JOB_PROCESSES", os.cpu_count() or 1))
+
+# Maximum number of queued and running jobs (per web worker). Submissions past it are rejected
+QUEUE_LIMIT = int(os.environ.get("KATNIP_JOB_QUEUE", 32))
+
+# Maximum number of projects in one batch
+BATCH_LIMIT = int(os.environ.get("KATNIP_BATCH_LIMIT", 500))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted while the queue is full
+    """
+
+class PoolUnavailable(Exception):
+    """
+    Raised when the worker pool can't take jobs (e.g. a worker process died)
+    """
+
+def _status_path(id: str):
+    return os.path.join("app_static", "generated_projects", id, f"status_{id}.json")
+
+def write_status(id: str, status: str, **details):
+    """
+    Writes the status of a job (atomically, so readers never see a half written file)
+
+    ### Parameters:
+    - id (str): The id of the job (and of its project)
+    - status (str): QUEUED, RUNNING, DONE or FAILED
+    - details: (optional) Extra fields of the status (e.g. error)
+    """
+
+    path = _status_path(id)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": id, "status": status, "updated": time.time(), **details}))
+    os.replace(path + ".tmp", path)
+
+def read_status(id: str):
+    """
+    Returns the status of a job
+
+    ### Parameters:
+    - id (str): The id of the job
+
+    ### Returns:
+    - status (dict | None): The status written by write_status(), None if there is no such job (or it was already served)
+    """
+
+    try:
+        with open(_status_path(id), "r", encoding="utf-8") as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _run(id: str, content: dict):
+    """
+    Compiles a job (runs in a worker process)
+
+    ### Parameters:
+    - id (str): The id of the job (and of its project)
+    - content (dict): The Scrtxt content (see project.process_scrtxt)
+
+    ### Returns:
+    - result (dict): The final status, and the sb3 file if the compile had no errors
+    """
+
+    write_status(id, RUNNING)
+    start = time.perf_counter()
+    with metrics.registry.in_flight():
+        project_parser = main_parser.project(id)
+        error = None
+        outcome = "ok"
+        try:
+            project_parser.process_scrtxt(content)
+        except error_handler.CmdError as e:
+            error = e.message
+            outcome = "cmd_error"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            outcome = "error"
+        project_parser.write(fast=True) # Like /translate, projects with errors are still written (with the blocks compiled so far)
+    metrics.registry.record_compile("jobs", outcome, time.perf_counter() - start, project_parser)
+
+    if error:
+        write_status(id, FAILED, error=error)
+        return {"status": FAILED, "error": error, "sb3": None}
+    write_status(id, DONE)
+    return {"status": DONE, "error": None, "sb3": project_parser.sb3}
+
+def compile_item(content: dict, fast: bool = True):
+    """
+    Compiles one project in memory (runs in a worker process, for batches). Nothing is written to disk
+
+    ### Parameters:
+    - content (dict): The Scrtxt content (see project.process_scrtxt)
+    - fast (bool): (optional) Compress with the fastest deflate level
+
+    ### Returns:
+    - result (dict): The status, error, sb3 file, compile log and timings (ms, with the stages of project.stage_timings()) of the project
+    """
+
+    start = time.perf_counter()
+    with metrics.registry.in_flight():
+        project_parser = main_parser.project(output=False)
+        error = None
+        outcome = "ok"
+        try:
+            project_parser.process_scrtxt(content)
+        except error_handler.CmdError as e:
+            error = e.message
+            outcome = "cmd_error"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            outcome = "error"
+        compiled = time.perf_counter()
+        sb3 = project_parser.build(fast)
+        end = time.perf_counter()
+    metrics.registry.record_compile("batch", outcome, end - start, project_parser)
+
+    return {"status": FAILED if error else DONE,
+            "error": error,
+            "sb3": sb3,
+            "log": "".join(project_parser.context.buffer),
+            "timings": {"compile_ms": round((compiled - start) * 1000, 3),
+                        "package_ms": round((end - compiled) * 1000, 3),
+                        "total_ms": round((end - start) * 1000, 3),
+                        "stages": project_parser.stage_timings()}}
+
+class job_queue():
+    """
+    Bounded queue of compile jobs. Safe to share between threads.
+    """
+
+    def __init__(self, processes: int = PROCESSES, limit: int = QUEUE_LIMIT):
+        """
+        ### Parameters:
+        - processes (int): (optional) Number of worker processes
+        - limit (int): (optional) Maximum number of queued and running jobs
+        """
+
+        self.processes = processes
+        self.limit = limit
+        self.pending = 0 # Queued and running jobs
+        self.pool = None # Created on the first submission
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        """
+        Returns the worker pool (lock must be held), creating it on first use
+        """
+
+        if self.pool is None:
+            # Spawned (not forked) workers, since the web worker has threads running
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    def run_batch(self, contents: list) -> list:
+        """
+        Compiles many projects at the same time on the worker pool, waiting for all of them.
+        The batch only takes the free places of the queue, and its projects go through them a few at a time, so the queue limit holds for batches too
+
+        ### Parameters:
+        - contents (list[dict]): The Scrtxt content of each project (see project.process_scrtxt)
+
+        ### Returns:
+        - results (list[dict]): The result of each project, in order (see compile_item)
+        """
+
+        if len(contents) > BATCH_LIMIT:
+            raise QueueFull(f"Batches can have at most [{BATCH_LIMIT}] projects, got [{len(contents)}]")
+
+        if not contents:
+            return []
+
+        with self.lock:
+            slots = min(len(contents), self.limit - self.pending) # Projects of the batch compiling (or queued) at once
+            if slots <= 0:
+                raise QueueFull(f"[{self.pending}] jobs are already queued")
+            pool = self._get_pool()
+            self.pending += slots # The batch counts against the queue until it finishes
+            metrics.registry.set("katnip_jobs_pending", self.pending)
+
+        try:
+            results = []
+            futures = deque()
+            for content in contents:
+                if len(futures) == slots: # Wait for a place
+                    results.append(futures.popleft().result())
+                futures.append(pool.submit(compile_item, content))
+            results.extend(future.result() for future in futures)
+            return results
+        except (BrokenProcessPool, RuntimeError) as e:
+            with self.lock:
+                if self.pool is pool:
+                    self.pool = None # Start a fresh pool for the next submission
+            raise PoolUnavailable(str(e))
+        finally:
+            with self.lock:
+                self.pending -= slots
+                metrics.registry.set("katnip_jobs_pending", self.pending)
+            metrics.registry.flush()
+
+    def submit(self, content: dict, on_done=None) -> str:
+        """
+        Queues a compile job
+
+        ### Parameters:
+        - content (dict): The Scrtxt content (see project.process_scrtxt)
+        - on_done (callable | None): (optional) Called with the job's result (see _run) when it finishes without crashing
+
+        ### Returns:
+        - id (str): The id of the job (and of its project)
+        """
+
+        with self.lock:
+            if self.pending >= self.limit:
+                raise QueueFull(f"[{self.pending}] jobs are already queued")
+            pool = self._get_pool()
+
+            id = str(uuid.uuid1())
+            os.makedirs(os.path.join("app_static", "generated_projects", id))
+            write_status(id, QUEUED)
+            try:
+                future = pool.submit(_run, id, content)
+            except (BrokenProcessPool, RuntimeError) as e:
+                self.pool = None # Start a fresh pool for the next submission
+                write_status(id, FAILED, error="Compile workers are unavailable")
+                raise PoolUnavailable(str(e))
+            self.pending += 1
+            metrics.registry.set("katnip_jobs_pending", self.pending)
+        metrics.registry.flush()
+
+        def _finished(future):
+            with self.lock:
+                self.pending -= 1
+                metrics.registry.set("katnip_jobs_pending", self.pending)
+            metrics.registry.flush()
+            try:
+                result = future.result()
+            except Exception as e: # The worker process died
+                with self.lock:
+                    if self.pool is pool:
+                        self.pool = None
+                write_status(id, FAILED, error=f"Compile worker crashed: {type(e).__name__}")
+                return
+            if on_done:
+                on_done(result)
+
+        future.add_done_callback(_finished)
+        return id
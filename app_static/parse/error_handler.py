@@ -3,6 +3,15 @@ Functions for throwing neat and descriptive errors
 """
 import os
 
+# Log levels. Messages below log_level are dropped before they reach the log buffer
+TRACE = 10 # Per-line parser trace ("On line", "Capturing line", "Getting block", ...)
+INFO = 20 # Compile progress (procedures, costumes, sounds, ...)
+ERROR = 40 # Errors. These are always recorded
+LEVELS = {"trace": TRACE, "info": INFO, "error": ERROR}
+
+# Set KATNIP_LOG_LEVEL=info (or error) to switch off the per-line trace in production
+log_level = LEVELS.get(os.environ.get("KATNIP_LOG_LEVEL", "trace").lower(), TRACE)
+
 class CmdError(Exception):
     """
     Raised when an invalid command is encountered
@@ -12,50 +21,88 @@ class CmdError(Exception):
         super().__init__(message)
         self.message = message
 
-errors = []
-def add_error(reason: str, relavent_code: str, line_num: int):
+def is_enabled(level: int):
     """
-    Adds a new error to the global list of errors, formatting it to look nice and consistent
-    
+    Returns whether messages of the given level are recorded. Use this to skip building expensive log messages.
+
     ### Parameters:
-    - reason (str): The reason for the error (what is the error)
-    - relavent_code (str): The code snippet where the error occurred
-    - line_num (int): The line number where the error occurred, -1 if not applicable
+    - level (int): The log level (TRACE, INFO or ERROR)
     """
 
-    if not line_num == -1:
-        errors.append(f"❌ - {reason} in code '{relavent_code}' on line [{line_num}]")
-    else:
-        errors.append(f"❌ - {reason} in code '{relavent_code}'")
+    return level >= log_level
 
-def throw_errors(id):
-    """
-    Executes a few things:
-    - Logs all the errors found in the global list
-    - Raises an exception if any errors were found
-
-    ### Parameters:
-    - id (str): The id of the file to log into
+class CompileContext():
     """
-    
-    if errors:
-        for error in errors:
-            log(id, error)
-        total_errors = len(errors)
-        errors.clear()
-
-        log(id, f"🛑 - [{total_errors}] invalid commands found. See above for details.")
-        raise CmdError(f"[{total_errors}] invalid commands found. See log for details.")
-    
-def log(id, message):
+    Error list and log buffer of a single compilation.
+    Every project owns its own context, so compiles running at the same time (e.g. in a threaded worker) never see each other's errors.
     """
-    Logs a message to the "logs.txt file"
-    
-    ### Parameters:
-    - id (str): The id of the file to log into
-    - message (str): The message to log
-    """
-    
-    with open(os.path.join('app_static', 'generated_projects', str(id), f"log_{id}.txt"), "a", encoding="utf-8") as f:
-        f.write(f"{message}\n")
-        f.close()
\ No newline at end of file
+
+    def __init__(self, id):
+        """
+        ### Parameters:
+        - id (str | None): The id of the project (and of its log file). Without an id, the log is only kept in memory (see flush())
+        """
+
+        self.id = id
+        self.errors = [] # Errors found since the last throw_errors()
+        self.buffer = [] # Log lines waiting to be flushed
+
+    def add_error(self, reason: str, relavent_code: str, line_num: int):
+        """
+        Adds a new error to the list of errors, formatting it to look nice and consistent
+
+        ### Parameters:
+        - reason (str): The reason for the error (what is the error)
+        - relavent_code (str): The code snippet where the error occurred
+        - line_num (int): The line number where the error occurred, -1 if not applicable
+        """
+
+        if not line_num == -1:
+            self.errors.append(f"❌ - {reason} in code '{relavent_code}' on line [{line_num}]")
+        else:
+            self.errors.append(f"❌ - {reason} in code '{relavent_code}'")
+
+    def throw_errors(self):
+        """
+        Executes a few things:
+        - Logs all the errors found in the list
+        - Flushes the log buffer (the compile stops here)
+        - Raises an exception if any errors were found
+        """
+
+        if self.errors:
+            for error in self.errors:
+                self.log(error, ERROR)
+            total_errors = len(self.errors)
+            self.errors.clear()
+
+            self.log(f"🛑 - [{total_errors}] invalid commands found. See above for details.", ERROR)
+            self.flush()
+            raise CmdError(f"[{total_errors}] invalid commands found. See log for details.")
+
+    def log(self, message, level=INFO):
+        """
+        Adds a message to the in-memory log buffer. The buffer is written to "log_<id>.txt" by flush()
+
+        ### Parameters:
+        - message (str): The message to log
+        - level (int): (optional) The log level of the message (TRACE, INFO or ERROR)
+        """
+
+        if level < log_level:
+            return
+        self.buffer.append(f"{message}\n")
+
+    def flush(self):
+        """
+        Writes all buffered log messages to the "log_<id>.txt" file at once. Contexts without an id keep their messages in the buffer
+        """
+
+        if not self.buffer or self.id is None:
+            return
+
+        lines = self.buffer
+        self.buffer = []
+        with open(os.path.join('app_static', 'generated_projects', str(self.id), f"log_{self.id}.txt"), "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.close()
@@ -0,0 +1,141 @@
+"""
+Tokenizer for Katnip source code. Reads the source exactly once, emitting tokens with their line and column positions
+"""
+
+import re
+from typing import NamedTuple
+
+# Token kinds
+STRING = "STRING"       # "text" (the text keeps its quotes)
+NUMBER = "NUMBER"       # 10, -2.5 (only characters in "-.0123456789")
+NAME = "NAME"           # Command names, and any other word
+VAR = "VAR"             # $variable
+LIST = "LIST"           # @list
+ARG = "ARG"             # a.argument (procedure argument)
+FN = "FN"               # fn.procedure (procedure call)
+FUNC = "FUNC"           # func: (procedure definition)
+ELSE = "ELSE"           # else
+LPAREN = "LPAREN"       # (
+RPAREN = "RPAREN"       # )
+LBRACE = "LBRACE"       # {
+RBRACE = "RBRACE"       # }
+COMMA = "COMMA"         # ,
+COLON = "COLON"         # :
+SEMICOLON = "SEMICOLON" # ;
+COMMENT = "COMMENT"     # # comment (the text keeps its '#')
+NEWLINE = "NEWLINE"     # End of a line
+
+class Token(NamedTuple):
+    kind: str # One of the token kinds above
+    text: str # The source text of the token
+    line: int # Line number of the token (starting at 1)
+    col: int  # Column of the token's first character (starting at 1)
+
+# One alternation for the whole language, so each character is looked at once (by the regex engine)
+_TOKEN_RE = re.compile(r'''
+      (?P<NEWLINE>\n)
+    | (?P<SPACE>[^\S\n]+)
+    | (?P<STRING>"[^"\n]*"?)
+    | (?P<COMMENT>\#[^\n]*)
+    | (?P<FUNC>func:)
+    | (?P<WORD>[^\s"\#(){},:;]+)
+    | (?P<PUNCT>[(){},:;])
+''', re.VERBOSE)
+
+_PUNCTUATION = {"(": LPAREN, ")": RPAREN, "{": LBRACE, "}": RBRACE, ",": COMMA, ":": COLON, ";": SEMICOLON}
+_NUMBER_RE = re.compile(r"[-.0-9]+")
+
+def _word_kind(word: str):
+    """
+    Returns the token kind of a word, based on its sigil (if any)
+
+    ### Parameters:
+    - word (str): The word to classify
+
+    ### Returns:
+    - kind (str): The token kind of the word
+    """
+
+    if word == "else":
+        return ELSE
+    if word[0] == "$":
+        return VAR
+    if word[0] == "@":
+        return LIST
+    if word.startswith("a."):
+        return ARG
+    if word.startswith("fn."):
+        return FN
+    if _NUMBER_RE.fullmatch(word):
+        return NUMBER
+    return NAME
+
+def tokenize(source: str) -> list[Token]:
+    """
+    Splits Katnip source code into tokens. Whitespace is dropped, except inside strings.
+    Every line (including the last one) ends with a NEWLINE token.
+
+    ### Parameters:
+    - source (str): The source code
+
+    ### Returns:
+    - tokens (list[Token]): The tokens of the source code
+    """
+
+    tokens = []
+    line = 1
+    line_start = 0
+    for match in _TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        text = match.group()
+        col = match.start() - line_start + 1
+
+        if kind == "NEWLINE":
+            tokens.append(Token(NEWLINE, text, line, col))
+            line += 1
+            line_start = match.end()
+        elif kind == "SPACE":
+            continue
+        elif kind == "WORD":
+            tokens.append(Token(_word_kind(text), text, line, col))
+        elif kind == "PUNCT":
+            tokens.append(Token(_PUNCTUATION[text], text, line, col))
+        else:
+            tokens.append(Token(kind, text, line, col))
+
+    tokens.append(Token(NEWLINE, "", line, len(source) - line_start + 1))
+    return tokens
+
+def split_lines(tokens: list[Token]) -> list[list[Token]]:
+    """
+    Groups tokens by source line (one list per line, without the NEWLINE tokens)
+
+    ### Parameters:
+    - tokens (list[Token]): Tokens returned by tokenize()
+
+    ### Returns:
+    - lines (list[list[Token]]): The tokens of each line
+    """
+
+    lines = []
+    current = []
+    for token in tokens:
+        if token.kind == NEWLINE:
+            lines.append(current)
+            current = []
+        else:
+            current.append(token)
+    return lines
+
+def glue(tokens: list[Token]) -> str:
+    """
+    Joins tokens back into text without the whitespace between them (Katnip ignores whitespace outside strings)
+
+    ### Parameters:
+    - tokens (list[Token]): The tokens to join
+
+    ### Returns:
+    - text (str): The joined text
+    """
+
+    return "".join([token.text for token in tokens])
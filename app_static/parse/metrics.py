@@ -0,0 +1,225 @@
+"""
+Operational metrics of the server, in the Prometheus text format.
+Every process (gunicorn workers and compile worker processes) keeps its own counters and writes them to its own file in a shared directory.
+collect() adds the files of all processes together, so any worker can answer a scrape for the whole server.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import uuid
+
+import asset_store
+
+# Directory shared by every process of the server. Metrics are only recorded when it is set (the server sets it, command line tools don't)
+DIR = os.environ.get("KATNIP_METRICS_DIR")
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Metric --> type and help text
+METRICS = {
+    "katnip_compiles_total": ("counter", "Compiles by endpoint and outcome (ok, cmd_error, error or cached)"),
+    "katnip_compile_seconds": ("histogram", "Compile latency by endpoint"),
+    "katnip_compile_stage_seconds": ("histogram", "Time spent in each compile stage (see project.stage_timings())"),
+    "katnip_blocks_emitted_total": ("counter", "Blocks generated by compiles"),
+    "katnip_sb3_bytes_total": ("counter", "Size of the sb3 files produced"),
+    "katnip_asset_bytes_decoded_total": ("counter", "Bytes of costumes and sounds decoded from data urls"),
+    "katnip_compiles_in_flight": ("gauge", "Compiles running right now"),
+    "katnip_jobs_pending": ("gauge", "Compile jobs queued or running"),
+    "katnip_generated_projects": ("gauge", "Project directories in app_static/generated_projects (compiled and not served yet)"),
+}
+
+def _key(name: str, labels: dict):
+    return name + json.dumps(labels, sort_keys=True)
+
+class metrics_store():
+    """
+    The metrics of this process. Safe to share between threads.
+    """
+
+    def __init__(self, directory: str = DIR):
+        """
+        ### Parameters:
+        - directory (str | None): (optional) The shared directory. Nothing is recorded if it is None
+        """
+
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.file = f"{self.pid}_{uuid.uuid4().hex[:8]}.json" # Pids get reused, so every process gets its own file
+        self.counters = {} # Key --> [name, labels, value]
+        self.gauges = {} # Key --> [name, labels, value]. Only counted while the process is alive
+        self.histograms = {} # Key --> [name, labels, bucket counts, sum, count]
+
+    def _check_fork(self):
+        # A forked child starts with its own (empty) metrics, instead of counting its parent's twice (lock must be held)
+        if self.pid != os.getpid():
+            self._reset()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Adds to a counter (or a gauge)
+        """
+
+        if self.directory is None:
+            return
+        with self.lock:
+            self._check_fork()
+            metrics = self.gauges if METRICS[name][0] == "gauge" else self.counters
+            metrics.setdefault(_key(name, labels), [name, labels, 0])[2] += value
+
+    def set(self, name: str, value: float, **labels):
+        """
+        Sets a gauge of this process
+        """
+
+        if self.directory is None:
+            return
+        with self.lock:
+            self._check_fork()
+            self.gauges[_key(name, labels)] = [name, labels, value]
+
+    def observe(self, name: str, seconds: float, **labels):
+        """
+        Adds a latency to a histogram
+        """
+
+        if self.directory is None:
+            return
+        with self.lock:
+            self._check_fork()
+            histogram = self.histograms.setdefault(_key(name, labels), [name, labels, [0] * len(BUCKETS), 0.0, 0])
+            for idx, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[2][idx] += 1
+            histogram[3] += seconds
+            histogram[4] += 1
+
+    def flush(self):
+        """
+        Writes the metrics of this process to its file in the shared directory (atomically, so readers never see a half written file)
+        """
+
+        if self.directory is None:
+            return
+        with self.lock:
+            self._check_fork()
+            decoded = asset_store.store.stats()["decoded_bytes"] # Per process, like these metrics
+            self.counters[_key("katnip_asset_bytes_decoded_total", {})] = ["katnip_asset_bytes_decoded_total", {}, decoded]
+            data = json.dumps({"pid": self.pid,
+                               "counters": list(self.counters.values()),
+                               "gauges": list(self.gauges.values()),
+                               "histograms": list(self.histograms.values())})
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.file)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def in_flight(self):
+        """
+        Counts the code inside a with block as a running compile
+        """
+
+        self.inc("katnip_compiles_in_flight")
+        self.flush()
+        try:
+            yield
+        finally:
+            self.inc("katnip_compiles_in_flight", -1)
+            self.flush()
+
+    def record_compile(self, endpoint: str, outcome: str, seconds: float, project_parser=None):
+        """
+        Records a finished compile and writes the metrics
+
+        ### Parameters:
+        - endpoint (str): Where the compile came from (translate, jobs or batch)
+        - outcome (str): ok, cmd_error, error or cached
+        - seconds (float): The compile's latency
+        - project_parser (main_parser.project | None): (optional) The compiled project, for its stage timings, blocks and sb3 size (None for cached projects)
+        """
+
+        self.inc("katnip_compiles_total", endpoint=endpoint, outcome=outcome)
+        self.observe("katnip_compile_seconds", seconds, endpoint=endpoint)
+        if project_parser is not None:
+            for stage, timing in project_parser.stage_timings().items():
+                self.observe("katnip_compile_stage_seconds", timing["ms"] / 1000, stage=stage)
+            self.inc("katnip_blocks_emitted_total", sum(len(target["blocks"]) for target in project_parser.data["targets"]))
+            self.inc("katnip_sb3_bytes_total", len(project_parser.sb3 or b""))
+        self.flush()
+
+    def collect(self, extra_gauges: dict = None) -> str:
+        """
+        Adds up the metrics of every process of the server
+
+        ### Parameters:
+        - extra_gauges (dict): (optional) Metric name --> value of gauges measured at scrape time (e.g. katnip_generated_projects)
+
+        ### Returns:
+        - text (str): The metrics in the Prometheus text format
+        """
+
+        self.flush()
+        counters = {}
+        histograms = {}
+        for file in sorted(os.listdir(self.directory)) if self.directory else []:
+            if not file.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, file), "r", encoding="utf-8") as f:
+                    data = json.loads(f.read())
+            except (OSError, ValueError):
+                continue
+
+            # Counters of finished processes still count, their gauges don't
+            series = data["counters"] + (data["gauges"] if _alive(data["pid"]) else [])
+            for name, labels, value in series:
+                counters.setdefault(_key(name, labels), [name, labels, 0])[2] += value
+            for name, labels, buckets, total, count in data["histograms"]:
+                histogram = histograms.setdefault(_key(name, labels), [name, labels, [0] * len(BUCKETS), 0.0, 0])
+                histogram[2] = [a + b for a, b in zip(histogram[2], buckets)]
+                histogram[3] += total
+                histogram[4] += count
+
+        for name, value in (extra_gauges or {}).items():
+            counters[_key(name, {})] = [name, {}, value]
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for _, labels, buckets, total, count in [histograms[key] for key in sorted(histograms) if histograms[key][0] == name]:
+                    for bound, bucket in zip(BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {bucket}")
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+            else:
+                for _, labels, value in [counters[key] for key in sorted(counters) if counters[key][0] == name]:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels: dict):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+def _alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # Alive, but owned by someone else
+        return True
+    return True
+
+registry = metrics_store() # Metrics of this process
@@ -1,4 +1,40 @@
-import app_static.parse.main_parser as main_parser
+"""
+Command line compiler: compiles .knp files (or whole directories / globs of them) to sb3 files, on a pool of processes.
+
+Usage (from the repository root):
+    python app_static/parse/run.py app_static/scripts -o build
+    python app_static/parse/run.py "app_static/scripts/code*.knp" -j 4 --logs --hierarchy
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+import archive
+import compile_jobs
+import hierarchy
+import main_parser
+
+SOURCE_EXTENSIONS = (".knp", ".katnip") # Picked up when a directory is given
+
+def default_content(code: str):
+    """
+    Wraps Katnip code into a project with the default stage and sprite
+
+    ### Parameters:
+    - code (str): Code of the sprite
+
+    ### Returns:
+    - content (dict): The Scrtxt content (see project.process_scrtxt)
+    """
+
+    return {"Stage": ["",[["Default-Blank", "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR4nGNgYGBgAAAABQABpfZFQAAAAABJRU5ErkJggg=="]]],
+            "S1": [code, [["Smile","data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGPgFvwPAAFGARyS/G3DAAAAAElFTkSuQmCC"]]]
+            }
 
 def translate(code):
     """
@@ -19,10 +55,111 @@ def translate(code):
     #appUi.open_sb3_TW(project_file) uncomment this line if you are running this locally to open with turbowarp
     return f'program_{project_parser.id}.sb3'
 
-with open("app_static\\scripts\\procedures2.knp", "r") as f:
-    code = f.read()
-    f.close()
+def find_sources(paths: list):
+    """
+    Expands the given files, directories and glob patterns into the source files to compile
+
+    ### Parameters:
+    - paths (list[str]): Files, directories (searched recursively for SOURCE_EXTENSIONS) and glob patterns
+
+    ### Returns:
+    - sources (list[str]): The source files, sorted and without duplicates
+    """
+
+    sources = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                sources.update(os.path.join(root, name) for name in files if name.endswith(SOURCE_EXTENSIONS))
+        elif os.path.isfile(path):
+            sources.add(path)
+        else:
+            matches = [match for match in glob.glob(path, recursive=True) if os.path.isfile(match)]
+            if not matches:
+                print(f"⚠️ - No files match [{path}]", file=sys.stderr)
+            sources.update(matches)
+    return sorted(os.path.normpath(source) for source in sources)
+
+def output_path(source: str, base: str, output_dir: str):
+    """
+    Returns where the sb3 file of a source goes: its path relative to base, inside output_dir (so equal file names in different directories don't clash)
+    """
+
+    relative = os.path.relpath(source, base)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + ".sb3")
+
+def _compile_file(source: str):
+    """
+    Compiles one source file (runs in a worker process)
+
+    ### Returns:
+    - result (dict): The result of compile_jobs.compile_item, plus the size of the source
+    """
+
+    with open(source, "r", encoding="utf-8") as f:
+        code = f.read()
+    result = compile_jobs.compile_item(default_content(code), fast=False)
+    result["source_bytes"] = len(code.encode("utf-8"))
+    return result
+
+def _report(source: str, result: dict, width: int):
+    timings = result["timings"]
+    icon = "✅" if result["status"] == compile_jobs.DONE else "❌"
+    line = f"{icon} - {source:<{width}}  {timings['total_ms']:9.2f} ms  (compile {timings['compile_ms']:.2f} ms, package {timings['package_ms']:.2f} ms)  {len(result['sb3']) / 1024:8.1f} KiB"
+    if result["error"]:
+        line += f"  {result['error']}"
+    print(line, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile Katnip files to sb3 files")
+    parser.add_argument("paths", nargs="+", help="source files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default=os.path.join("app_static", "generated_projects"), help="output directory (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of compiling processes (default: %(default)s)")
+    parser.add_argument("--logs", action="store_true", help="write the compile log next to every sb3 file (logs of failed files are always written)")
+    parser.add_argument("--hierarchy", action="store_true", help="write the block hierarchy next to every sb3 file")
+    args = parser.parse_args(argv)
+
+    sources = find_sources(args.paths)
+    if not sources:
+        print("❌ - Nothing to compile", file=sys.stderr)
+        return 1
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(source)) for source in sources])
+    width = max(len(source) for source in sources)
+
+    start = time.perf_counter()
+    results = {}
+    if args.jobs > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(sources)), mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_compile_file, source): source for source in sources}
+            for future in as_completed(futures):
+                source = futures[future]
+                results[source] = future.result()
+                _report(source, results[source], width)
+    else:
+        for source in sources:
+            results[source] = _compile_file(source)
+            _report(source, results[source], width)
+
+    # Write the sb3 files (and logs and hierarchies)
+    for source, result in results.items():
+        path = output_path(os.path.abspath(source), base, args.output)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(result["sb3"])
+        if args.logs or result["status"] != compile_jobs.DONE:
+            with open(os.path.splitext(path)[0] + ".log.txt", "w", encoding="utf-8") as f:
+                f.write(f"Log file for {source}\n" + result["log"])
+        if args.hierarchy:
+            with open(os.path.splitext(path)[0] + ".hierarchy.txt", "w", encoding="utf-8") as f:
+                hierarchy.write_hierarchy(archive.read_project(result["sb3"]), f)
+    elapsed = time.perf_counter() - start
+
+    failed = len([result for result in results.values() if result["status"] != compile_jobs.DONE])
+    compile_time = sum(result["timings"]["total_ms"] for result in results.values()) / 1000
+    source_bytes = sum(result["source_bytes"] for result in results.values())
+    print(f"\n📦 - {len(results) - failed}/{len(results)} files compiled into [{args.output}] in {elapsed:.2f} s "
+          f"({len(results) / elapsed:.1f} files/s, {source_bytes / 1024 / elapsed:.1f} KiB/s of source, {compile_time:.2f} s of compile time on {min(args.jobs, len(sources))} processes)")
+    return 1 if failed else 0
 
-    translate({"Stage": ["",[["Default-Blank", "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR4nGNgYGBgAAAABQABpfZFQAAAAABJRU5ErkJggg=="]]],
-               "S1": [code, [["Smile","data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGPgFvwPAAFGARyS/G3DAAAAAElFTkSuQmCC"]]]
-               })
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
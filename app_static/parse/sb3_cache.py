@@ -0,0 +1,109 @@
+"""
+In-memory cache of compiled sb3 files, keyed by a hash of the submitted code
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+
+import command_manager
+import main_parser
+
+# Maximum total size (in bytes) of the cached sb3 files. Set KATNIP_SB3_CACHE_BYTES=0 to switch the cache off
+MAX_BYTES = int(os.environ.get("KATNIP_SB3_CACHE_BYTES", 64 * 1024 * 1024))
+
+def cache_key(content: dict) -> str:
+    """
+    Returns the cache key of a compile: a hash of the code (and assets) plus the compiler and commands.txt versions
+
+    ### Parameters:
+    - content (dict): The Scrtxt content given to project.process_scrtxt
+
+    ### Returns:
+    - key (str): Hex digest identifying the compiled sb3
+    """
+
+    key = hashlib.sha256()
+    key.update(main_parser.COMPILER_VERSION.encode("utf-8"))
+    key.update(b"\0" + command_manager.version().encode("utf-8") + b"\0")
+    key.update(json.dumps(content, sort_keys=True).encode("utf-8"))
+    return key.hexdigest()
+
+class sb3_cache():
+    """
+    LRU cache of sb3 bytes, bounded by the total number of bytes it holds. Safe to share between threads.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        """
+        ### Parameters:
+        - max_bytes (int): (optional) Maximum total size of the cached files
+        """
+
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # Cache key --> sb3 bytes (least recently used first)
+        self.size = 0 # Total size of the cached files
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        """
+        Returns the cached sb3 for a key, counting the hit or miss
+
+        ### Parameters:
+        - key (str): Key returned by cache_key()
+
+        ### Returns:
+        - data (bytes | None): The sb3 file, None if it is not cached
+        """
+
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        """
+        Caches an sb3 file, evicting the least recently used files until the cache fits in max_bytes
+
+        ### Parameters:
+        - key (str): Key returned by cache_key()
+        - data (bytes): The sb3 file
+        """
+
+        if len(data) > self.max_bytes: # Would evict everything else and still not fit
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters (for sizing the cache)
+
+        ### Returns:
+        - stats (dict): hits, misses, evictions, entries, bytes and max_bytes
+        """
+
+        with self.lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "entries": len(self.entries),
+                    "bytes": self.size,
+                    "max_bytes": self.max_bytes}
@@ -0,0 +1,176 @@
+"""
+Scaling runner: compiles synthetic programs (see synthetic.py) while growing one knob at a time, and plots the time of each compile stage
+and the peak memory against the knob. A growth exponent is fitted per stage, so super-linear stages stand out.
+
+Usage (from the repository root):
+    python app_static/parse/scaling.py -o scaling
+    python app_static/parse/scaling.py --knob lines=1000,5000,20000 --knob expr_depth=0,2,4,6
+"""
+
+import argparse
+from dataclasses import asdict, fields
+import json
+import math
+import os
+import sys
+import tracemalloc
+
+import benchmark
+import error_handler
+import synthetic
+
+# Knob --> values swept by default. The other knobs keep the values of BASE
+SWEEPS = {
+    "lines": [250, 500, 1000, 2000, 4000, 8000, 16000],
+    "scripts": [1, 5, 10, 50, 100, 500],
+    "depth": [0, 1, 2, 4, 8, 16],
+    "expr_depth": [0, 1, 2, 3, 4, 5, 6],
+    "procedures": [1, 4, 16, 64, 256],
+    "calls": [0, 50, 100, 200, 400, 800],
+    "variables": [1, 10, 100, 1000],
+    "lists": [1, 10, 100, 1000],
+    "broadcasts": [1, 10, 100, 1000],
+}
+BASE = synthetic.Shape(lines=1000, scripts=10)
+SUPER_LINEAR = 1.2 # Growth exponents above this are flagged
+
+def measure(code: str, repeat: int):
+    """
+    Compiles a program, timing every stage (best of repeat compiles), then measures the peak memory in one traced compile
+
+    ### Returns:
+    - result (dict): blocks, total_ms, peak_bytes and the ms of each stage
+    """
+
+    best = None
+    for _ in range(repeat):
+        timer, blocks = benchmark.compile_once(code)
+        if best is None or sum(timer.times.values()) < sum(best.times.values()):
+            best = timer
+
+    tracemalloc.start()
+    try:
+        memory, _ = benchmark.compile_once(code, memory=True)
+    finally:
+        tracemalloc.stop()
+
+    return {"blocks": blocks,
+            "total_ms": round(sum(best.times.values()) * 1000, 3),
+            "peak_bytes": max(memory.peaks.values()),
+            "stages": {stage: round(best.times[stage] * 1000, 3) for stage in benchmark.STAGES}}
+
+def growth(sizes: list, values: list):
+    """
+    Fits values ~ sizes ** k (least squares in log-log space), returning k. 1 is linear, 2 is quadratic. None if there are too few usable points
+    """
+
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, values) if size > 0 and value > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in points) / spread, 3)
+
+def sweep(knob: str, values: list, base: synthetic.Shape, repeat: int):
+    """
+    Compiles one program per value of a knob
+
+    ### Returns:
+    - result (dict): The points ({value, lines, blocks, total_ms, peak_bytes, stages}) and the growth exponent of each stage (see growth_against)
+    """
+
+    points = []
+    for value in values:
+        code = synthetic.generate(base, **{knob: value})
+        try:
+            point = measure(code, repeat)
+        except error_handler.CmdError as e:
+            print(f"❌ - {knob}={value}: {e.message}")
+            continue
+        point = {"value": value, "lines": len(code.splitlines()), **point}
+        points.append(point)
+        print(f"📏 - {knob}={value:<8} {point['lines']:>7} lines {point['blocks']:>8} blocks {point['total_ms']:>11.2f} ms {point['peak_bytes'] / 1024 / 1024:>9.2f} MiB peak", flush=True)
+
+    # Fit against the number of blocks when the knob adds code, so e.g. deeper expressions (more blocks per line) aren't mistaken for super-linear.
+    # Knobs that barely change the amount of code (depth, variables, ...) are fitted against their own value
+    blocks = [point["blocks"] for point in points]
+    against = "blocks" if blocks and min(blocks) and max(blocks) / min(blocks) >= 2 else knob
+    sizes = blocks if against == "blocks" else [point["value"] for point in points]
+    exponents = {stage: growth(sizes, [point["stages"][stage] for point in points]) for stage in benchmark.STAGES}
+    exponents["total"] = growth(sizes, [point["total_ms"] for point in points])
+    exponents["peak_bytes"] = growth(sizes, [point["peak_bytes"] for point in points])
+    for stage, exponent in exponents.items():
+        if exponent is not None and exponent > SUPER_LINEAR:
+            print(f"⚠️ - {stage} grows like {against}^{exponent} with {knob}")
+    return {"points": points, "growth_against": against, "growth": exponents}
+
+def plot(knob: str, result: dict, output_dir: str):
+    """
+    Plots the stage times and the peak memory against a knob into <output_dir>/scaling_<knob>.png. Needs matplotlib
+
+    ### Returns:
+    - path (str | None): The image, None if matplotlib is not installed
+    """
+
+    try:
+        import matplotlib # Only needed for the plots
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return None
+
+    points = result["points"]
+    values = [point["value"] for point in points]
+    figure, (times, memory) = plt.subplots(1, 2, figsize=(12, 5))
+    for stage in benchmark.STAGES:
+        times.plot(values, [point["stages"][stage] for point in points], marker="o", label=f"{stage} (k={result['growth'][stage]})")
+    times.plot(values, [point["total_ms"] for point in points], marker="o", color="black", label=f"total (k={result['growth']['total']})")
+    times.set(xlabel=knob, ylabel="ms", title=f"Compile time vs {knob}")
+    times.legend(fontsize="small")
+    memory.plot(values, [point["peak_bytes"] / 1024 / 1024 for point in points], marker="o")
+    memory.set(xlabel=knob, ylabel="MiB", title=f"Peak memory vs {knob}")
+    figure.tight_layout()
+
+    path = os.path.join(output_dir, f"scaling_{knob}.png")
+    figure.savefig(path)
+    plt.close(figure)
+    return path
+
+def main(argv=None):
+    knobs = [field.name for field in fields(synthetic.Shape) if field.name != "seed"]
+    parser = argparse.ArgumentParser(description="Plot compile time and memory against the size and shape of synthetic programs")
+    parser.add_argument("--knob", action="append", default=[], metavar="NAME[=V1,V2,...]", help=f"knob to sweep, optionally with its values (default: all of {', '.join(SWEEPS)})")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="compiles per point, the fastest is kept (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=BASE.seed, help="seed of the generated programs (default: %(default)s)")
+    parser.add_argument("-o", "--output", default="scaling", help="directory for scaling.json and the plots (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    sweeps = {}
+    for knob in args.knob:
+        name, _, values = knob.partition("=")
+        if name not in knobs:
+            parser.error(f"unknown knob '{name}' (knobs: {', '.join(knobs)})")
+        sweeps[name] = [int(value) for value in values.split(",")] if values else SWEEPS[name]
+    sweeps = sweeps or SWEEPS
+
+    base = synthetic.Shape(**{**asdict(BASE), "seed": args.seed})
+    os.makedirs(args.output, exist_ok=True)
+    results = {"base": asdict(base), "knobs": {}}
+    plotted = True
+    for knob, values in sweeps.items():
+        print(f"\n🔧 - Sweeping {knob}")
+        results["knobs"][knob] = sweep(knob, values, base, args.repeat)
+        plotted = plot(knob, results["knobs"][knob], args.output) is not None and plotted
+
+    with open(os.path.join(args.output, "scaling.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(results, indent=1))
+    if not plotted:
+        print("\n⚠️ - matplotlib is not installed, so no plots were drawn (the numbers are in scaling.json)")
+    print(f"\n💾 - Results written to [{args.output}]")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
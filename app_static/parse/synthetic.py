@@ -0,0 +1,187 @@
+"""
+Generates valid Katnip programs of a given size and shape, for scaling tests of the compiler (see scaling.py).
+
+Usage (from the repository root):
+    python app_static/parse/synthetic.py --lines 20000 --depth 4 --expr-depth 3 -o big.knp
+"""
+
+import argparse
+from dataclasses import asdict, dataclass
+import random
+import sys
+
+@dataclass
+class Shape:
+    scripts: int = 10      # Number of hat scripts (whenFlag / whenBroadcast)
+    lines: int = 200       # Number of statement lines over all scripts (c-block lines included)
+    depth: int = 2         # Nesting depth of if / ifElse / repeat / forever blocks
+    expr_depth: int = 2    # Depth of the expressions inside arguments (0 --> plain values)
+    procedures: int = 4    # Number of func: procedures (defined after the scripts, so every call is a forward call)
+    calls: int = 8         # Number of fn. calls in the scripts
+    variables: int = 8     # Number of variables
+    lists: int = 4         # Number of lists
+    broadcasts: int = 4    # Number of broadcasts (sent in the scripts and received by whenBroadcast scripts)
+    seed: int = 0          # Random seed. The same shape and seed always give the same program
+
+_NUMBER_OPS = ["add", "subtract", "multiply", "mod"]
+_COMPARE_OPS = ["equals", "lt", "gt"]
+_PROCEDURE_LINES = 4 # Statements in the body of a procedure
+
+class _writer():
+    """
+    Writes one program. Keeps the random state and the names in scope
+    """
+
+    def __init__(self, config: Shape):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.args = [] # Arguments of the procedure being written
+        self.calls_left = config.calls
+        self.out = []
+
+    def _value(self):
+        choices = [lambda: str(self.rng.randint(0, 99)), lambda: f'"s{self.rng.randint(0, 9)}"']
+        if self.config.variables:
+            choices.append(lambda: f"$v{self.rng.randrange(self.config.variables)}")
+        if self.config.lists:
+            choices.append(lambda: f"listLength(@l{self.rng.randrange(self.config.lists)})")
+        if self.args:
+            choices.append(lambda: f"a.{self.rng.choice(self.args)}")
+        return self.rng.choice(choices)()
+
+    def expression(self, depth: int = None):
+        """
+        Returns a reporter expression (a full tree of the given depth)
+        """
+
+        depth = self.config.expr_depth if depth is None else depth
+        if depth <= 0:
+            return self._value()
+        return f"{self.rng.choice(_NUMBER_OPS)}({self.expression(depth - 1)}, {self.expression(depth - 1)})"
+
+    def condition(self):
+        depth = max(self.config.expr_depth - 1, 0)
+        return f"{self.rng.choice(_COMPARE_OPS)}({self.expression(depth)}, {self.expression(depth)})"
+
+    def statement(self):
+        """
+        Returns a single line stack block
+        """
+
+        kind = self.rng.randrange(6)
+        if self.calls_left and self.config.procedures and self.rng.random() < 0.5:
+            self.calls_left -= 1
+            return self.call()
+        if kind == 0 and self.config.variables:
+            return f"setvar($v{self.rng.randrange(self.config.variables)}, {self.expression()})"
+        if kind == 1 and self.config.variables:
+            return f"changevar($v{self.rng.randrange(self.config.variables)}, {self.expression()})"
+        if kind == 2 and self.config.lists:
+            return f"listAdd(@l{self.rng.randrange(self.config.lists)}, {self.expression()})"
+        if kind == 3 and self.config.broadcasts:
+            return f'sendBroadcast("b{self.rng.randrange(self.config.broadcasts)}")'
+        if kind == 4:
+            return f"say({self.expression()})"
+        return f"move({self.expression()})"
+
+    def call(self):
+        idx = self.rng.randrange(self.config.procedures)
+        return f"fn.p{idx}(" + ", ".join(f"x{arg}: {self.expression()}" for arg in range(idx % 3 + 1)) + ")"
+
+    def body(self, lines: int, level: int, indent: str, last: bool):
+        """
+        Writes lines statement lines, nesting c-blocks until the configured depth
+
+        ### Parameters:
+        - lines (int): Lines to write (c-block headers and closing braces included)
+        - level (int): Current nesting depth
+        - indent (str): Indent of the lines
+        - last (bool): Whether this body ends its script (only there can a forever block go)
+        """
+
+        written = 0
+        first = True
+        while written < lines:
+            left = lines - written
+            # The first statement of each level nests, so every script reaches the full depth
+            if level < self.config.depth and left >= 3 and (first or self.rng.random() < 0.2):
+                inner = max(1, (left - 2) // 2 if first else min(left - 2, self.rng.randint(1, 6)))
+                kind = self.rng.randrange(4)
+                if kind == 3 and last: # Nothing may follow a forever block, so it takes the rest of the script
+                    inner = left - 2
+                    self.out.append(f"{indent}forever() {{")
+                elif kind == 2 and left >= inner * 2 + 3:
+                    self.out.append(f"{indent}if({self.condition()}) {{")
+                    self.body(inner, level + 1, indent + "    ", False)
+                    self.out.append(f"{indent}}} else {{")
+                    written += inner + 1
+                elif kind == 1:
+                    self.out.append(f"{indent}repeat({self.expression()}) {{")
+                else:
+                    self.out.append(f"{indent}if({self.condition()}) {{")
+                self.body(inner, level + 1, indent + "    ", last and written + inner + 2 >= lines)
+                self.out.append(f"{indent}}}")
+                written += inner + 2
+            else:
+                self.out.append(indent + self.statement())
+                written += 1
+            first = False
+
+    def program(self):
+        config = self.config
+        scripts = max(config.scripts, 1)
+        for idx in range(scripts):
+            lines = config.lines // scripts + (1 if idx < config.lines % scripts else 0)
+            if idx % 2 and config.broadcasts:
+                self.out.append(f'whenBroadcast("b{idx // 2 % config.broadcasts}") {{')
+            else:
+                self.out.append("whenFlag() {")
+            self.body(max(lines, 1), 0, "    ", True)
+            self.out.append("}")
+            self.out.append("")
+
+        # Procedures come last, so all the calls above are forward calls
+        self.calls_left = 0
+        for idx in range(config.procedures):
+            self.args = [f"x{arg}" for arg in range(idx % 3 + 1)]
+            self.out.append(f"func: p{idx}(warp: true, " + ", ".join(f"{arg}[exp]" for arg in self.args) + ") {")
+            self.body(_PROCEDURE_LINES, max(config.depth - 1, 0), "    ", False)
+            self.out.append("}")
+            self.out.append("")
+        self.args = []
+
+        return "\n".join(self.out)
+
+def generate(config: Shape = None, **knobs) -> str:
+    """
+    Generates a Katnip program
+
+    ### Parameters:
+    - config (Shape | None): (optional) The shape of the program
+    - knobs: (optional) Fields of Shape to set (e.g. lines=20000, depth=4)
+
+    ### Returns:
+    - program (str): The program's source code
+    """
+
+    config = Shape(**{**(asdict(config) if config else {}), **knobs})
+    return _writer(config).program()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Katnip program")
+    for name, value in asdict(Shape()).items():
+        parser.add_argument("--" + name.replace("_", "-"), type=int, default=value, help="(default: %(default)s)")
+    parser.add_argument("-o", "--output", help="file to write the program to (default: stdout)")
+    args = vars(parser.parse_args(argv))
+    output = args.pop("output")
+
+    program = generate(**args)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(program)
+    else:
+        sys.stdout.write(program)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
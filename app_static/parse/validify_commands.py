@@ -19,6 +19,7 @@ def validify_commands(id):
     """
     
     print(f"🔍 - Validating commands...")
+    context = error_handler.CompileContext(id)
 
     with open(os.path.join('app_static', 'references', 'commands.txt'), "r") as f:
         commands = f.readlines() # Read file
@@ -39,27 +40,27 @@ def validify_commands(id):
 
             # Check if command has 4 parts (useName:opCode:type:inputName1,inputName2, ...)
             if len(command_parts) < 4:
-                error_handler.add_error(f"📜❌ - Invalid arguments length. Expected 4 parts, but received [{len(command_parts)}]", command, line_num)
+                context.add_error(f"📜❌ - Invalid arguments length. Expected 4 parts, but received [{len(command_parts)}]", command, line_num)
                 continue
 
             # Check if useName, opCode, and type are non-empty
             if command_parts[0] == "":
-                error_handler.add_error(f"📜❌ - Invalid useName argument. Blank argument received.", command, line_num)
+                context.add_error(f"📜❌ - Invalid useName argument. Blank argument received.", command, line_num)
                 continue
             if command_parts[1] == "":
-                error_handler.add_error(f"📜❌ - Invalid opCode argument. Blank argument received.", command, line_num)
+                context.add_error(f"📜❌ - Invalid opCode argument. Blank argument received.", command, line_num)
                 continue
             if command_parts[2] == "":
-                error_handler.add_error(f"📜❌ - Invalid useName argument. Blank argument received.", command, line_num)
+                context.add_error(f"📜❌ - Invalid useName argument. Blank argument received.", command, line_num)
                 continue
 
             # Check if useName, opCode, and type are unique
             if command_parts[0] in all_names:
                 print(command_parts[0])
-                error_handler.add_error(f"📜❌ - Duplicate useName found. ", command, line_num)
+                context.add_error(f"📜❌ - Duplicate useName found. ", command, line_num)
                 continue
             if command_parts[1] in all_opcodes:
-                error_handler.add_error(f"📜❌ - Duplicate opCode found. ", command, line_num)
+                context.add_error(f"📜❌ - Duplicate opCode found. ", command, line_num)
                 continue
 
             # Add useName and opCode to list of processed commands
@@ -68,7 +69,7 @@ def validify_commands(id):
 
 
         # Raise exception if invalid commands exist
-        error_handler.throw_errors(id)
+        context.throw_errors()
         print("✅ - All commands are valid.")
         
 # validify_commands()
\ No newline at end of file
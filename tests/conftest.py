@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The compiler modules import each other flatly, and read their files relative to the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app_static", "parse"))
+os.chdir(ROOT)
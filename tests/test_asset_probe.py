@@ -0,0 +1,43 @@
+import struct
+
+from asset_probe import mp3_info
+
+HEADER = b"\xff\xfb\x90\x00" # MPEG 1 layer III, 128 kbit/s, 44100 Hz, stereo
+FRAME_LENGTH = 417 # 144 * 128000 // 44100
+SAMPLES = 1152 # Per frame
+
+def frames(count: int):
+    return (HEADER + bytes(FRAME_LENGTH - 4)) * count
+
+def header_frame(tag: bytes, offset: int, fields: bytes):
+    # A frame without audio holding a VBR header at offset (from the start of the frame)
+    frame = bytearray(HEADER + bytes(FRAME_LENGTH - 4))
+    frame[offset:offset + len(tag) + len(fields)] = tag + fields
+    return bytes(frame)
+
+def test_frame_walk():
+    assert mp3_info(frames(10)) == (10 * SAMPLES, 44100)
+
+def test_info_header_with_frame_count():
+    info = header_frame(b"Info", 4 + 32, struct.pack(">II", 1, 7)) # Frames flag, 7 frames
+    assert mp3_info(info + frames(10)) == (7 * SAMPLES, 44100)
+
+def test_info_header_without_frame_count():
+    info = header_frame(b"Info", 4 + 32, struct.pack(">I", 0)) # No flags, so its frame is skipped and the rest walked
+    assert mp3_info(info + frames(10)) == (10 * SAMPLES, 44100)
+
+def test_vbri_header():
+    vbri = header_frame(b"VBRI", 36, bytes(10) + struct.pack(">I", 7)) # Frame count at offset 50
+    assert mp3_info(vbri + frames(10)) == (7 * SAMPLES, 44100)
+
+def test_junk_between_frames():
+    assert mp3_info(frames(4) + b"\x00junk\xff\x00" * 5 + frames(6)) == (10 * SAMPLES, 44100)
+
+def test_id3_tag_is_skipped():
+    body = HEADER * 8 # Would look like frames if the tag was not skipped
+    size = len(body)
+    tag = b"ID3\x04\x00\x00" + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) + body
+    assert mp3_info(tag + frames(10)) == (10 * SAMPLES, 44100)
+
+def test_no_frames():
+    assert mp3_info(b"\x00" * 1000) is None
@@ -0,0 +1,46 @@
+import base64
+
+from asset_store import asset_store
+
+def data_url(mime: str, data: bytes):
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="4" height="4"></svg>'
+
+def test_same_bytes_under_another_mime_type():
+    store = asset_store(max_bytes=1024)
+
+    svg = store.load(data_url("image/svg+xml", SVG))
+    other = store.load(data_url("text/plain", SVG))
+
+    assert svg.md5 == other.md5
+    assert (svg.ext, other.ext) == ("svg", "bin")
+    assert store.load(data_url("image/svg+xml", SVG)).ext == "svg" # Not replaced by the later load
+    assert store.stats()["entries"] == 2
+
+def test_oversized_asset_is_not_stored():
+    store = asset_store(max_bytes=100)
+    store.load(data_url("text/plain", b"a" * 50))
+
+    big = store.load(data_url("text/plain", b"b" * 200))
+
+    assert big.data == b"b" * 200
+    stats = store.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (1, 50, 0)
+
+def test_least_recently_used_assets_are_evicted():
+    store = asset_store(max_bytes=100)
+    first, second, third = (data_url("text/plain", byte * 40) for byte in (b"a", b"b", b"c"))
+    store.load(first)
+    store.load(second)
+    store.load(first) # Now the second asset is the least recently used
+
+    store.load(third)
+
+    stats = store.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 80, 1)
+    hits = stats["hits"]
+    store.load(first)
+    assert store.stats()["hits"] == hits + 1
+    store.load(second) # Evicted, so decoded again
+    assert store.stats()["misses"] == stats["misses"] + 1
@@ -0,0 +1,27 @@
+import pytest
+
+import compile_jobs
+import run
+
+def test_batch_larger_than_the_free_queue_places(monkeypatch):
+    queue = compile_jobs.job_queue(processes=1, limit=2)
+    queue.pending = 1 # One job is already queued
+    pending = []
+    monkeypatch.setattr(compile_jobs.metrics.registry, "set", lambda name, value, **labels: pending.append(value))
+
+    try:
+        results = queue.run_batch([run.default_content(f"whenFlag() {{\nsay({n})\n}}\n") for n in range(3)])
+    finally:
+        if queue.pool:
+            queue.pool.shutdown()
+
+    assert [result["status"] for result in results] == [compile_jobs.DONE] * 3
+    assert max(pending) <= queue.limit
+    assert queue.pending == 1
+
+def test_batch_with_a_full_queue():
+    queue = compile_jobs.job_queue(processes=1, limit=2)
+    queue.pending = 2
+
+    with pytest.raises(compile_jobs.QueueFull):
+        queue.run_batch([run.default_content("whenFlag() {\nsay(1)\n}\n")])
@@ -0,0 +1,23 @@
+import hierarchy
+import main_parser
+import run
+
+def test_empty_if_else_body():
+    project_parser = main_parser.project(output=False)
+    project_parser.process_scrtxt(run.default_content("whenFlag() {\nif(mouse()) {\n} else {\n  move(1)\n}\n}\n"), processes=0)
+
+    text = hierarchy.gen_hierarchy(project_parser.data)
+
+    assert "control_if_else" in text
+    assert "SUBSTACK2:" in text
+    assert "motion_movesteps" in text
+
+def test_empty_substack_input():
+    # Projects compiled before empty substacks were left out have inputs pointing at no block
+    blocks = {"block-1": {"opcode": "control_if_else", "next": None, "fields": {},
+                          "inputs": {"SUBSTACK": [2, ""], "SUBSTACK2": [2, "block-2"]}},
+              "block-2": {"opcode": "motion_movesteps", "next": None, "fields": {}, "inputs": {}}}
+
+    assert hierarchy.generate_ascii_hierarchy(blocks) == ("├─ block-1: control_if_else\n"
+                                                          "│   ├─ SUBSTACK2:\n"
+                                                          "│       └─ block-2: motion_movesteps\n")
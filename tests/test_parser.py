@@ -0,0 +1,128 @@
+import glob
+import json
+import os
+
+import pytest
+
+import ast_parser
+import error_handler
+import main_parser
+import run
+
+GOLDEN_DIR = os.path.join("tests", "golden") # project.json of every app_static/scripts/*.knp. Set KATNIP_UPDATE_GOLDEN=1 to rewrite them
+SCRIPTS = sorted(glob.glob(os.path.join("app_static", "scripts", "*.knp")))
+
+def parse(code: str):
+    return ast_parser.parse(code, error_handler.CompileContext(None), cache=False)
+
+def compile_project(code: str):
+    project_parser = main_parser.project(output=False)
+    project_parser.process_scrtxt(run.default_content(code), processes=0)
+    return project_parser
+
+def compile_errors(code: str):
+    project_parser = main_parser.project(output=False)
+    with pytest.raises(error_handler.CmdError):
+        project_parser.process_scrtxt(run.default_content(code), processes=0)
+    return "".join(line for line in project_parser.context.buffer if "❌" in line)
+
+def sprite_blocks(project_parser):
+    return project_parser.data["targets"][1]["blocks"]
+
+def test_else_after_a_nested_block_belongs_to_the_enclosing_block():
+    program = parse("whenFlag() {\n"
+                    "if(mouse()) {\n"
+                    "    if(mouse()) {\n"
+                    "        say(1)\n"
+                    "    }\n"
+                    "} else {\n"
+                    "    say(2)\n"
+                    "}\n"
+                    "}\n")
+
+    outer = program.scripts[0].statements[1]
+    inner = outer.substacks[0][0]
+    assert len(outer.substacks) == 2
+    assert [statement.name for statement in outer.substacks[1]] == ["say"]
+    assert len(inner.substacks) == 1
+
+def test_else_inside_a_nested_block_belongs_to_the_nested_block():
+    program = parse("whenFlag() {\n"
+                    "if(mouse()) {\n"
+                    "    if(mouse()) {\n"
+                    "        say(1)\n"
+                    "    } else {\n"
+                    "        say(2)\n"
+                    "    }\n"
+                    "}\n"
+                    "}\n")
+
+    outer = program.scripts[0].statements[1]
+    inner = outer.substacks[0][0]
+    assert len(outer.substacks) == 1
+    assert len(inner.substacks) == 2
+    assert [statement.name for statement in inner.substacks[1]] == ["say"]
+
+def test_else_on_the_line_after_the_closing_brace():
+    program = parse("whenFlag() {\nif(mouse()) {\n    say(1)\n}\nelse {\n    say(2)\n}\n}\n")
+
+    assert len(program.scripts[0].statements[1].substacks) == 2
+
+def test_empty_substacks():
+    blocks = sprite_blocks(compile_project("whenFlag() {\nif(mouse()) {\n}\nif(mouse()) {\n} else {\n    move(1)\n}\n}\n"))
+
+    empty_if, if_else = [block for block in blocks.values() if block["opcode"] in ("control_if", "control_if_else")]
+    assert "SUBSTACK" not in empty_if["inputs"] and "SUBSTACK2" not in empty_if["inputs"]
+    assert "SUBSTACK" not in if_else["inputs"]
+    assert blocks[if_else["inputs"]["SUBSTACK2"][1]]["opcode"] == "motion_movesteps"
+
+def test_deep_expression():
+    depth = 5000 # Far beyond the recursion limit
+    blocks = sprite_blocks(compile_project("whenFlag() {\nsay(" + "add(" * depth + "1" + ", 1)" * depth + ")\n}\n"))
+
+    adds = [block for block in blocks.values() if block["opcode"] == "operator_add"]
+    assert len(adds) == depth
+    assert sum(1 for block in adds if "NUM1" in block["inputs"] and block["inputs"]["NUM1"][0] == 1) == 1 # Only the innermost add has a number
+
+def test_deep_stack():
+    depth = 5000
+    blocks = sprite_blocks(compile_project("whenFlag() {\n" + "if(mouse()) {\n" * depth + "say(1)\n" + "}\n" * depth + "}\n"))
+
+    say = next(block_id for block_id, block in blocks.items() if block["opcode"] == "looks_say")
+    parents = 0
+    block_id = say
+    while blocks[block_id]["parent"] is not None:
+        block_id = blocks[block_id]["parent"]
+        parents += 1
+    assert parents == depth + 1 # Every if, and the hat block
+
+@pytest.mark.parametrize("code, message", [
+    ("say(foo bar)", "Invalid argument type in code 'foobar'"),
+    ("say(add(1 2))", "'add' expects [2] arguments, but got [1]"),
+    ("say(1, 2)", "'say' expects [1] arguments, but got [2]"),
+    ("if(1) {\n}", "Expected 'boolean', got 'num'"),
+    ("if(mouse()) {\n} else {\n} else {\n}", "Unexpected 'else'"),
+    ("if(mouse()) {\nif(mouse()) {\nsay(1)", "Unexpected end of code block"), # The last '}' only closes the inner block
+    ("fn.f(1)", "':' not found for argument '1'"),
+])
+def test_invalid_arguments(code, message):
+    assert message in compile_errors("whenFlag() {\n" + code + "\n}\n")
+
+@pytest.mark.parametrize("script", SCRIPTS, ids=os.path.basename)
+def test_golden_project_json(script):
+    with open(script, "r", encoding="utf-8") as f:
+        code = f.read()
+    try:
+        result = compile_project(code).data
+    except error_handler.CmdError as e:
+        result = {"error": e.message}
+    result = json.loads(json.dumps(result)) # As written into the sb3
+
+    path = os.path.join(GOLDEN_DIR, os.path.splitext(os.path.basename(script))[0] + ".json")
+    if os.environ.get("KATNIP_UPDATE_GOLDEN"):
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(result, indent=1, ensure_ascii=False) + "\n")
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert result == json.loads(f.read())
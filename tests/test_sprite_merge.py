@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import main_parser
+import run
+import synthetic
+
+def content(*programs: str):
+    # One sprite per program, after the (empty) stage
+    sprites = run.default_content("")
+    costumes = sprites["S1"][1]
+    del sprites["S1"]
+    for idx, program in enumerate(programs):
+        sprites[f"S{idx + 1}"] = [program, costumes]
+    return sprites
+
+def compile_json(sprites: dict, processes: int):
+    project_parser = main_parser.project(output=False)
+    project_parser.process_scrtxt(sprites, processes=processes)
+    return json.dumps(project_parser.data)
+
+def procedure(name: str):
+    return f"func: {name}(warp: true, x[exp]) {{\n    say(a.x)\n    move($speed)\n}}\n"
+
+def calls(name: str):
+    return f"whenFlag() {{\n    fn.{name}(x: $speed)\n    say(\"hi\")\n    sendBroadcast(\"go\")\n}}\n"
+
+CASES = {
+    "separate sprites": (content(calls("a") + procedure("a"), synthetic.generate(seed=1, procedures=0), calls("b") + procedure("b")), True),
+    "shared procedures": (content(calls("a") + procedure("a"), calls("a")), False),
+    "open last script": (content("whenFlag() {\n    say(1)\n}\nsay(2)\n", calls("b") + procedure("b")), False),
+}
+
+@pytest.mark.parametrize("name", CASES)
+def test_worker_processes_give_the_serial_project(name):
+    sprites, parallel = CASES[name]
+
+    project_parser = main_parser.project(output=False)
+    assert (project_parser._compile_sprites(sprites, 2) is not None) == parallel # Falls back to the serial compile where it has to
+
+    assert compile_json(sprites, 2) == compile_json(sprites, 0)
+
+def teardown_module():
+    if main_parser._sprite_pool is not None:
+        main_parser._sprite_pool.shutdown()
+        main_parser._sprite_pool = None